@@ -10,16 +10,52 @@ import threading
 from tkinter import font
 import webbrowser
 import urllib.parse
+import urllib.request
+import urllib.error
+import http.client
+import http.server
+import socketserver
+import concurrent.futures
+import sys
 import time
 import schedule
 from threading import Timer
 import subprocess
 import platform
+import sqlite3
+import bisect
+import heapq
+import random
+import queue
+import smtplib
+import ssl
+from email.message import EmailMessage
+from collections import deque, Counter
+from types import MappingProxyType
+import asyncio
+import gzip
+import shutil
+import mmap
+import contextlib
+from array import array
 try:
     import yagmail
     EMAIL_AVAILABLE = True
 except ImportError:
     EMAIL_AVAILABLE = False
+
+# Optional async clients for the notification engine (falls back to thread executors)
+try:
+    import aiosmtplib
+    AIOSMTPLIB_AVAILABLE = True
+except ImportError:
+    AIOSMTPLIB_AVAILABLE = False
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
     
 # Try to import pandas for Excel export
 try:
@@ -28,10 +64,3661 @@ try:
 except ImportError:
     PANDAS_AVAILABLE = False
 
+# CRASH-SAFE STATE FILES (write temp -> fsync -> rename, with rotating generations)
+STATE_GENERATIONS = 3  # Previous copies kept as file.json.1 (newest) .. file.json.3
+
+
+def _fsync_directory(directory):
+    """Persist renames in a directory (not supported on Windows, where it is skipped)"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory or '.', os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+_state_file_locks = {}
+_state_file_locks_guard = threading.Lock()
+
+
+def _state_file_lock(path):
+    """One lock per state file, so concurrent saves of the same file take turns"""
+    key = os.path.abspath(path)
+    with _state_file_locks_guard:
+        return _state_file_locks.setdefault(key, threading.Lock())
+
+
+class AtomicFileBatch:
+    """Writes several state files so each is either fully old or fully new after a crash"""
+
+    def __init__(self, generations=STATE_GENERATIONS):
+        self.generations = generations
+        self._pending = []  # (target path, temp path, open file)
+
+    def write_text(self, path, text):
+        """Stage new contents for path; nothing is visible until commit()"""
+        # Per-thread temp name: two threads saving the same file must not share one
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        f = open(tmp_path, 'w', encoding='utf-8')
+        f.write(text)
+        f.flush()
+        self._pending.append((path, tmp_path, f))
+        return len(text.encode('utf-8'))
+
+    def write_json(self, path, data, **dump_kwargs):
+        """Stage a JSON document for path; returns bytes staged"""
+        dump_kwargs.setdefault('indent', 2)
+        dump_kwargs.setdefault('default', str)
+        return self.write_text(path, json.dumps(data, **dump_kwargs))
+
+    def _rotate(self, path):
+        for i in range(self.generations - 1, 0, -1):
+            older = f"{path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{path}.{i + 1}")
+        if self.generations > 0 and os.path.exists(path):
+            os.replace(path, f"{path}.1")
+
+    def commit(self):
+        """fsync every staged file, then rotate and rename them into place"""
+        try:
+            # One fsync pass for the whole save cycle before any rename happens
+            for _, _, f in self._pending:
+                os.fsync(f.fileno())
+        finally:
+            for _, _, f in self._pending:
+                f.close()
+        directories = set()
+        # Rotation is several renames; lock the targets (in a fixed order) so
+        # concurrent commits of the same file cannot interleave them
+        targets = sorted({os.path.abspath(path) for path, _, _ in self._pending})
+        locks = [_state_file_lock(path) for path in targets]
+        for lock in locks:
+            lock.acquire()
+        try:
+            for path, tmp_path, _ in self._pending:
+                self._rotate(path)
+                os.replace(tmp_path, path)
+                directories.add(os.path.dirname(os.path.abspath(path)))
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        for directory in directories:
+            _fsync_directory(directory)
+        self._pending = []
+
+    def abort(self):
+        """Throw away staged files, leaving the targets untouched"""
+        for _, tmp_path, f in self._pending:
+            f.close()
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+
+def atomic_write_json(path, data, generations=STATE_GENERATIONS, **dump_kwargs):
+    """Crash-safe replacement for json.dump(data, open(path, 'w'))"""
+    with AtomicFileBatch(generations) as batch:
+        return batch.write_json(path, data, **dump_kwargs)
+
+
+def load_json_state(path, default=None, generations=STATE_GENERATIONS):
+    """Load a state file, falling back to the newest readable generation"""
+    candidates = [path] + [f"{path}.{i}" for i in range(1, generations + 1)]
+    for candidate in candidates:
+        if not os.path.exists(candidate):
+            continue
+        try:
+            with open(candidate, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read {candidate}: {e}")
+            continue
+        if candidate != path:
+            print(f"Recovered {path} from {candidate}")
+        return data
+    return default
+
+
+# APPOINTMENT RECORD (compact, with parsed values cached once per load/edit)
+def clean_phone_number(phone):
+    """Clean and format phone number for WhatsApp"""
+    if not phone or not phone.strip():
+        return None
+    
+    # Remove all non-digit characters except +
+    clean = re.sub(r'[^\d+]', '', phone.strip())
+    
+    # If no country code, add default (change +1 to your country code)
+    if not clean.startswith('+'):
+        # Remove leading zeros
+        clean = clean.lstrip('0')
+        # Add country code (change +1 to your country code)
+        clean = '+1' + clean
+    
+    # Remove + for WhatsApp URL (wa.me expects numbers without +)
+    return clean.replace('+', '')
+
+
+def parse_appointment_datetime(date_str, time_str='09:00'):
+    """Combine 'YYYY-MM-DD' and 'HH:MM' into a datetime, or None if invalid"""
+    try:
+        if not date_str:
+            return None
+        appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        appointment_time = datetime.strptime(time_str, '%H:%M').time()
+        return datetime.combine(appointment_date, appointment_time)
+    except (TypeError, ValueError):
+        return None
+
+
+_MISSING = object()
+
+
+class Appointment:
+    """Slotted appointment record that still reads and serializes like the old dict"""
+
+    FIELDS = (
+        'id', 'patient_name', 'procedure', 'phone_number', 'phone_number2', 'email',
+        'clinic_date', 'appointment_date', 'appointment_time', 'enable_reminders',
+        'enable_email', 'notes', 'created_at', 'updated_at'
+    )
+    # Fields whose change invalidates the cached values below
+    CACHED_FROM = frozenset(('patient_name', 'procedure', 'phone_number', 'notes',
+                             'appointment_date', 'appointment_time'))
+
+    __slots__ = FIELDS + ('extra', 'datetime', 'clean_phone', 'search_name',
+                          'search_procedure', 'search_notes', 'version')
+
+    def __init__(self, data=None, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, _MISSING)
+        self.extra = None
+        self.version = 0  # Stamped by AppointmentBook whenever a new record is published
+        values = dict(data or {}, **fields)
+        for key, value in values.items():
+            self._set(key, value)
+        self._refresh_cache()
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build from a stored dict (passes Appointment instances through)"""
+        return data if isinstance(data, cls) else cls(data)
+
+    def _set(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def _refresh_cache(self):
+        self.datetime = parse_appointment_datetime(self.get('appointment_date'),
+                                                   self.get('appointment_time', '09:00'))
+        self.clean_phone = clean_phone_number(self.get('phone_number') or '')
+        self.search_name = (self.get('patient_name') or '').lower()
+        self.search_procedure = (self.get('procedure') or '').lower()
+        self.search_notes = (self.get('notes') or '').lower()
+
+    # dict-style access, so existing apt['x'] / apt.get('x') code keeps working
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._set(key, value)
+        if key in self.CACHED_FROM:
+            self._refresh_cache()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default=None):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            return default if value is _MISSING else value
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        return default
+
+    def update(self, values):
+        for key, value in values.items():
+            self._set(key, value)
+        if self.CACHED_FROM.intersection(values):
+            self._refresh_cache()
+
+    def keys(self):
+        keys = [name for name in self.FIELDS if getattr(self, name) is not _MISSING]
+        if self.extra:
+            keys.extend(self.extra)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self):
+        """Serialize back to the appointments.json dict schema"""
+        return dict(self.items())
+
+    def copy(self):
+        return Appointment(self.to_dict())
+
+    def __repr__(self):
+        return f"Appointment({self.to_dict()!r})"
+
+
+# SECONDARY INDEXES (date range, phone, procedure category)
+def procedure_category(procedure):
+    """Category shown on the dashboard: the part before ':' ("MRI: Knee" -> "MRI")"""
+    return (procedure or '').split(':')[0]
+
+
+class AppointmentIndexes:
+    """Sorted date index plus phone and procedure hash indexes, updated per record"""
+
+    def __init__(self):
+        self._by_date = []  # sorted (appointment_date, appointment_time, id)
+        self._by_phone = {}  # cleaned phone -> set of ids
+        self._by_procedure = {}  # procedure category -> set of ids
+        self._keys = {}  # id -> (date key, phone, category) as last indexed
+
+    def clear(self):
+        self._by_date = []
+        self._by_phone = {}
+        self._by_procedure = {}
+        self._keys = {}
+
+    def rebuild(self, appointments):
+        """Index a whole data set at once (load/import)"""
+        self.clear()
+        for appointment in appointments:
+            self._keys[appointment['id']] = self._index_keys(appointment)
+        self._by_date = sorted(keys[0] for keys in self._keys.values() if keys[0])
+        for apt_id, (_, phone, category) in self._keys.items():
+            self._by_phone.setdefault(phone, set()).add(apt_id)
+            self._by_procedure.setdefault(category, set()).add(apt_id)
+
+    def _index_keys(self, appointment):
+        apt_date = appointment.get('appointment_date')
+        date_key = (apt_date, appointment.get('appointment_time') or '', appointment['id']) if apt_date else None
+        return date_key, appointment.clean_phone, procedure_category(appointment.get('procedure'))
+
+    def add(self, appointment):
+        apt_id = appointment['id']
+        date_key, phone, category = keys = self._index_keys(appointment)
+        self._keys[apt_id] = keys
+        if date_key:
+            bisect.insort(self._by_date, date_key)
+        self._by_phone.setdefault(phone, set()).add(apt_id)
+        self._by_procedure.setdefault(category, set()).add(apt_id)
+
+    def remove(self, apt_id):
+        keys = self._keys.pop(apt_id, None)
+        if not keys:
+            return
+        date_key, phone, category = keys
+        if date_key:
+            i = bisect.bisect_left(self._by_date, date_key)
+            if i < len(self._by_date) and self._by_date[i] == date_key:
+                del self._by_date[i]
+        for index, key in ((self._by_phone, phone), (self._by_procedure, category)):
+            ids = index.get(key)
+            if ids:
+                ids.discard(apt_id)
+                if not ids:
+                    del index[key]
+
+    def update(self, appointment):
+        """Re-index one record after an edit"""
+        self.remove(appointment['id'])
+        self.add(appointment)
+
+    def _date_range(self, start_date, end_date):
+        lo = bisect.bisect_left(self._by_date, (start_date,))
+        hi = bisect.bisect_left(self._by_date, (end_date + '\uffff',))
+        return lo, hi
+
+    def ids_between(self, start_date, end_date):
+        """Ids with start_date <= appointment_date <= end_date ('YYYY-MM-DD'), in date/time order"""
+        lo, hi = self._date_range(start_date, end_date)
+        return [key[2] for key in self._by_date[lo:hi]]
+
+    def count_between(self, start_date, end_date):
+        lo, hi = self._date_range(start_date, end_date)
+        return hi - lo
+
+    def ids_for_phone(self, phone):
+        return set(self._by_phone.get(clean_phone_number(phone), ()))
+
+    def ids_for_procedure(self, category):
+        return set(self._by_procedure.get(category, ()))
+
+    def procedure_counts(self):
+        """{category: number of appointments}"""
+        return {category: len(ids) for category, ids in self._by_procedure.items()}
+
+
+# APPOINTMENT BOOK (id -> record index with a monotonic id sequence)
+class AppointmentBook:
+    """Appointments keyed by id, in insertion order, with O(1) lookup, add and delete"""
+
+    # Writers change the id -> record dict in place under _lock, and edits replace the
+    # record instead of mutating it, so a write stays O(1). Readers on other threads get
+    # a frozen copy from snapshot(); it is made on the first read after a write and then
+    # shared until the next one.
+
+    def __init__(self):
+        self._records = {}  # id -> Appointment; a record is never mutated once added
+        self._snapshot = None  # Read-only copy of _records, dropped by every write
+        self._lock = threading.RLock()
+        self.next_id = 1
+        self.version = 0  # Last version stamped on a published record
+        self.indexes = AppointmentIndexes()
+        self.listeners = []  # objects with appointment_added/_updated/_removed and appointments_loaded
+
+    def add_listener(self, listener):
+        """Keep a derived structure (scheduler, search index, ...) in step with the book"""
+        with self._lock:
+            self.listeners.append(listener)
+            listener.appointments_loaded(tuple(self._records.values()))
+
+    def snapshot(self):
+        """Read-only id -> appointment view that later changes never touch"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = MappingProxyType(dict(self._records))
+                snapshot = self._snapshot
+        return snapshot
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        # The live dict may change size under another thread, so iterate the snapshot
+        return iter(self.snapshot().values())
+
+    def __contains__(self, apt_id):
+        return apt_id in self._records
+
+    def get(self, apt_id):
+        """Return the appointment with this id, or None"""
+        return self._records.get(apt_id)
+
+    def first(self):
+        """Return the oldest appointment, or None"""
+        return next(iter(self._records.values()), None)
+
+    def _stamp(self, appointment):
+        """Give a record about to be published a new version, so views can tell it changed"""
+        self.version += 1
+        appointment.version = self.version
+
+    def allocate_id(self):
+        """Hand out the next id; ids are never reused, even after a delete"""
+        with self._lock:
+            apt_id = self.next_id
+            self.next_id += 1
+            return apt_id
+
+    def add(self, appointment):
+        """Add an appointment that already has a unique id"""
+        with self._lock:
+            if appointment['id'] in self._records:
+                raise ValueError(f"Duplicate appointment id {appointment['id']}")
+            self._stamp(appointment)
+            self.indexes.add(appointment)
+            self._records[appointment['id']] = appointment
+            self._snapshot = None
+            self.next_id = max(self.next_id, appointment['id'] + 1)
+            for listener in self.listeners:
+                listener.appointment_added(appointment)
+
+    def update(self, apt_id, values):
+        """Replace an appointment with an edited copy; returns the new record"""
+        with self._lock:
+            appointment = self._records[apt_id].copy()
+            appointment.update(values)
+            self._stamp(appointment)
+            self.indexes.update(appointment)
+            self._records[apt_id] = appointment
+            self._snapshot = None
+            for listener in self.listeners:
+                listener.appointment_updated(appointment)
+            return appointment
+
+    def remove(self, apt_id):
+        """Remove and return the appointment with this id, or None"""
+        with self._lock:
+            if apt_id not in self._records:
+                return None
+            appointment = self._records.pop(apt_id)
+            self.indexes.remove(apt_id)
+            self._snapshot = None
+            for listener in self.listeners:
+                listener.appointment_removed(apt_id)
+            return appointment
+
+    def on_date(self, date_str):
+        """Appointments on one 'YYYY-MM-DD' day, ordered by time"""
+        return self.between(date_str, date_str)
+
+    def index_lookup(self, lookup):
+        """Run lookup(indexes) under the writer lock, since the indexes are updated in place"""
+        with self._lock:
+            return lookup(self.indexes)
+
+    def between(self, start_date, end_date):
+        """Appointments in an inclusive date range, ordered by date and time"""
+        # The indexes are updated in place, so read them under the writer lock
+        with self._lock:
+            records = self._records
+            return [records[apt_id] for apt_id in self.indexes.ids_between(start_date, end_date)]
+
+    def load(self, appointments, next_id=None):
+        """Replace the contents, renumbering duplicate or invalid ids; returns [(old_id, new_id)]"""
+        with self._lock:
+            records = {}
+            ids = [apt.get('id') for apt in appointments]
+            valid_ids = [apt_id for apt_id in ids if isinstance(apt_id, int)]
+            self.next_id = max([int(next_id or 1)] + [apt_id + 1 for apt_id in valid_ids])
+
+            repaired = []
+            for appointment in appointments:
+                apt_id = appointment.get('id')
+                if not isinstance(apt_id, int) or apt_id in records:
+                    new_id = self.allocate_id()
+                    repaired.append((apt_id, new_id))
+                    appointment['id'] = new_id
+                records[appointment['id']] = appointment
+                self._stamp(appointment)
+            self.indexes.rebuild(records.values())
+            self._records = records
+            self._snapshot = None
+            for listener in self.listeners:
+                listener.appointments_loaded(tuple(records.values()))
+            return repaired
+
+
+# SEARCH INDEX (trigram, word and phone-digit postings kept in step with the book)
+SEARCH_DEBOUNCE_MS = 150  # Search once typing pauses this long
+SEARCH_RESULT_LIMIT = 200  # Ranked results shown per search
+SEARCH_CANDIDATE_LIMIT = 20000  # Word-prefix candidates a fuzzy query seeds from its first two letters
+FUZZY_CANDIDATE_LIMIT = 400  # Records sharing the most trigrams with a fuzzy query that get scored
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def phone_digits(phone):
+    """Digits of a phone number or query ("+1 (555) 010" -> "1555010")"""
+    return re.sub(r'\D', '', phone or '')
+
+
+def bounded_levenshtein(a, b, limit, prefix=False):
+    """Edit distance from a to b (or to b's closest prefix), or limit + 1 once it must exceed limit"""
+    # Swapping two neighbouring letters ("Jhon") counts as one edit, like a single typo
+    too_far = limit + 1
+    if not prefix and abs(len(a) - len(b)) > limit:
+        return too_far
+    # Only cells within `limit` of the diagonal can stay under the limit
+    before = None
+    previous = [j if j <= limit else too_far for j in range(len(b) + 1)]
+    for i, char in enumerate(a, 1):
+        current = [too_far] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        best = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != b[j - 1]))
+            if before and j > 1 and char == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+            if value < best:
+                best = value
+        if best > limit:
+            return too_far
+        before, previous = previous, current
+    return min(min(previous) if prefix else previous[-1], too_far)
+
+
+class SearchIndex:
+    """Live-search postings: trigrams of name/procedure, notes and phone, words of name/procedure/notes"""
+
+    # Postings are append-only arrays of ids: an edit posts the record under its new keys and
+    # leaves the old entries behind. Every candidate is checked against the live record, so a
+    # stale entry only costs a lookup, and the postings are rebuilt once stale edits pile up.
+    # A load only swaps the records in; postings are built by warm() or the first search.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._built = False
+        self._records = {}  # id -> appointment as last indexed
+        self._grams = {}  # name/procedure trigram -> ids
+        self._words = {}  # name/procedure/notes word -> ids
+        self._word_list = []  # sorted words, for prefix lookups
+        self._phone_grams = {}  # phone digit and raw phone trigram -> ids
+        self._note_grams = {}  # notes trigram -> ids (kept apart so notes do not sway fuzzy name scores)
+        self._stale = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    # Book listener hooks (called under the book's lock)
+    def appointments_loaded(self, appointments):
+        with self._lock:
+            self._reset()
+            self._records = {appointment['id']: appointment for appointment in appointments}
+
+    def appointment_added(self, appointment):
+        with self._lock:
+            if self._built:
+                self._add(appointment)
+            else:
+                self._records[appointment['id']] = appointment
+
+    def appointment_updated(self, appointment):
+        with self._lock:
+            if self._built:
+                self._add(appointment, self._records.get(appointment['id']))
+                self._maybe_rebuild()
+            else:
+                self._records[appointment['id']] = appointment
+
+    def appointment_removed(self, apt_id):
+        with self._lock:
+            if self._records.pop(apt_id, None) is not None and self._built:
+                self._stale += 1
+                self._maybe_rebuild()
+
+    def warm(self):
+        """Build the postings now (e.g. on a background thread after startup)"""
+        with self._lock:
+            if not self._built:
+                self._reindex(list(self._records.values()))
+
+    def _reindex(self, appointments):
+        self._reset()
+        keys = self._keys
+        for appointment in appointments:
+            apt_id = appointment['id']
+            self._records[apt_id] = appointment
+            for postings, posted in zip(self._postings(), keys(appointment)):
+                for key in posted:
+                    ids = postings.get(key)
+                    if ids is None:
+                        ids = postings[key] = array('I')
+                    ids.append(apt_id)
+        self._word_list = sorted(self._words)
+        self._built = True
+
+    def _maybe_rebuild(self):
+        if self._stale > max(len(self._records), 1000):
+            self._reindex(list(self._records.values()))
+
+    def _postings(self):
+        """The posting maps, in the order _keys() returns their keys"""
+        return self._grams, self._words, self._phone_grams, self._note_grams
+
+    @staticmethod
+    def _keys(appointment):
+        name, procedure, notes = appointment.search_name, appointment.search_procedure, appointment.search_notes
+        phone = appointment.get('phone_number') or ''
+        return (trigrams(name) | trigrams(procedure),
+                set(f"{name} {procedure} {notes}".split()),
+                trigrams(phone_digits(phone)) | trigrams(phone),
+                trigrams(notes))
+
+    def _add(self, appointment, previous=None):
+        """Post a record under the keys it did not have before"""
+        apt_id = appointment['id']
+        old_keys = self._keys(previous) if previous is not None else (set(), set(), set(), set())
+        for postings, keys, old in zip(self._postings(), self._keys(appointment), old_keys):
+            for key in keys - old:
+                ids = postings.get(key)
+                if ids is None:
+                    ids = postings[key] = array('I')
+                    if postings is self._words:
+                        bisect.insort(self._word_list, key)
+                ids.append(apt_id)
+            if old - keys:
+                self._stale += 1
+        self._records[apt_id] = appointment
+
+    @staticmethod
+    def _intersect(postings, keys):
+        """Ids posted under the rarest keys; the rest of the match is checked per record"""
+        lists = sorted((postings.get(key, ()) for key in keys), key=len)
+        if not lists or not lists[0]:
+            return set()
+        found = set(lists[0])
+        for ids in lists[1:3]:
+            found.intersection_update(ids)
+        return found
+
+    def _word_prefix(self, prefix):
+        """Ids of records with a word starting with prefix"""
+        found = set()
+        position = bisect.bisect_left(self._word_list, prefix)
+        while position < len(self._word_list) and self._word_list[position].startswith(prefix):
+            found.update(self._words[self._word_list[position]])
+            if len(found) >= SEARCH_CANDIDATE_LIMIT:
+                break
+            position += 1
+        return found
+
+    @staticmethod
+    def rank(appointment, term, digits=''):
+        """Lower is better; None if the record does not contain term"""
+        name = appointment.search_name
+        position = name.find(term)
+        if position == 0:
+            return 0
+        if position > 0:
+            return 1 if name[position - 1] == ' ' else 2
+        if digits and digits in phone_digits(appointment.get('phone_number')):
+            return 3
+        if term in (appointment.get('phone_number') or ''):
+            return 3
+        if term in appointment.search_procedure:
+            return 4
+        if term in appointment.search_notes:
+            return 5
+        return None
+
+    def candidates(self, term):
+        """Ids that may contain term (lowercase), a superset rank() verifies, and the records"""
+        digits = phone_digits(term)
+        with self._lock:
+            if not self._built:
+                self._reindex(list(self._records.values()))
+            # Trigrams cannot serve a term, or the phone digits in it, shorter than three
+            # characters; those queries check every record, like the plain scan did
+            if len(term) < 3 or 0 < len(digits) < 3:
+                return set(self._records), self._records
+            grams = trigrams(term)
+            found = self._intersect(self._grams, grams)
+            found |= self._intersect(self._note_grams, grams)
+            found |= self._intersect(self._phone_grams, grams)
+            if digits != term:
+                found |= self._intersect(self._phone_grams, trigrams(digits))
+            return found, self._records
+
+    @staticmethod
+    def typo_limit(word):
+        """Edits tolerated in a query word of this length"""
+        return 0 if len(word) <= 2 else 1 if len(word) <= 5 else 2
+
+    @classmethod
+    def name_distance(cls, words, name_words):
+        """Summed edits from each query word to its closest name word, or None if one is too far"""
+        total = 0
+        for position, word in enumerate(words):
+            allowed = cls.typo_limit(word)
+            # The last word may still be being typed, so it is matched against name word prefixes
+            partial = position == len(words) - 1
+            best = min((bounded_levenshtein(word, name_word, allowed, partial) for name_word in name_words),
+                       default=allowed + 1)
+            if best > allowed:
+                return None
+            total += best
+        return total
+
+    def fuzzy(self, term, limit=SEARCH_RESULT_LIMIT, cancelled=None):
+        """Appointments whose patient name is within a few typos of term, closest first"""
+        term = term.strip().lower()
+        if len(term) < 3:
+            return self.search(term, limit, cancelled)
+        # Only the records sharing the most trigrams with the query are scored
+        shared = Counter()
+        with self._lock:
+            if not self._built:
+                self._reindex(list(self._records.values()))
+            for gram in trigrams(term):
+                ids = self._grams.get(gram)
+                if ids:
+                    shared.update(ids)
+            # Short names can lose every trigram to one typo ("omr"); their first letters still count
+            shared.update(self._word_prefix(term[:2]))
+            records = self._records
+        if cancelled and cancelled():
+            return []
+        words = term.split()
+        ranked = []
+        for apt_id, count in heapq.nlargest(FUZZY_CANDIDATE_LIMIT, shared.items(), key=lambda item: item[1]):
+            appointment = records.get(apt_id)
+            if appointment is not None:
+                distance = self.name_distance(words, appointment.search_name.split())
+                if distance is not None:
+                    ranked.append((distance, -count, appointment.search_name, apt_id))
+        ranked.sort()
+        return [records[apt_id] for _, _, _, apt_id in ranked[:limit]]
+
+    def phone_candidates(self, digits):
+        """Ids whose phone digits may contain digits (3 or more); a superset to verify"""
+        with self._lock:
+            if not self._built:
+                self._reindex(list(self._records.values()))
+            return self._intersect(self._phone_grams, trigrams(digits))
+
+    def search(self, term, limit=SEARCH_RESULT_LIMIT, cancelled=None):
+        """Best `limit` appointments containing term in name, phone, procedure or notes"""
+        term = term.strip().lower()
+        if not term:
+            return []
+        # Digits only count as a phone search when the query looks like a phone number
+        digits = phone_digits(term) if re.fullmatch(r'[\d\s+()\-.]+', term) else ''
+        found, records = self.candidates(term)
+        ranked = []
+        for checked, apt_id in enumerate(found):
+            # cancelled() is polled every so often so a superseded query stops early
+            if cancelled and not checked % 1024 and cancelled():
+                return []
+            appointment = records.get(apt_id)
+            if appointment is not None:
+                rank = self.rank(appointment, term, digits)
+                if rank is not None:
+                    ranked.append((rank, appointment.search_name, apt_id))
+        return [records[apt_id] for _, _, apt_id in heapq.nsmallest(limit, ranked)]
+
+
+def _misspell(word, rng):
+    """Drop, double or swap one inner letter, the way names get mistyped at a front desk"""
+    i = rng.randrange(1, len(word) - 1)
+    edit = rng.choice(("drop", "double", "swap"))
+    if edit == "drop":
+        return word[:i] + word[i + 1:]
+    if edit == "double":
+        return word[:i] + word[i] + word[i:]
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def benchmark_search(count=100000, queries=50, seed=7):
+    """Type misspelled names one key at a time against `count` synthetic patients"""
+    rng = random.Random(seed)
+    first = ("Mohammed", "Muhammad", "Mohamed", "Ahmed", "Ahmad", "Fatima", "Fatma", "Aisha", "Omar",
+             "Youssef", "Ibrahim", "Khadija", "Mariam", "Layla", "John", "Jon", "Sarah", "Sara", "Michael",
+             "Anna", "Hannah", "Peter", "Catherine", "Katherine", "Priya", "Chen", "Kwame", "Olga")
+    last = ("Hassan", "Hussein", "Ali", "Khan", "Abdullah", "Rahman", "Smith", "Smyth", "Johnson",
+            "Garcia", "Okafor", "Nguyen", "Ibrahim", "Rossi", "Mueller", "Brown", "Patel", "Kowalski")
+    procedures = ("MRI: Knee", "CT: Chest", "X-Ray: Hand", "Ultrasound: Abdomen", "Consultation")
+    index = SearchIndex()
+    index.appointments_loaded([
+        Appointment(id=n, patient_name=f"{rng.choice(first)} {rng.choice(last)}",
+                    procedure=rng.choice(procedures), phone_number=f"+1 555-{rng.randrange(10 ** 7):07d}")
+        for n in range(1, count + 1)
+    ])
+    started = time.perf_counter()
+    index.warm()
+    built = time.perf_counter() - started
+    typed = [_misspell(rng.choice(first), rng) for _ in range(queries)]
+    results = {"build": built}
+    for mode, run in (("exact", index.search), ("fuzzy", index.fuzzy)):
+        timings, hits = [], 0
+        for word in typed:
+            for end in range(1, len(word) + 1):
+                started = time.perf_counter()
+                found = run(word[:end])
+                timings.append(time.perf_counter() - started)
+            hits += bool(found)
+        timings.sort()
+        p50, p95 = timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+        results[mode] = {"p50": p50, "p95": p95, "found": hits}
+        print(f"{mode:>5} search: p50 {p50 * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms per keystroke "
+              f"({len(timings)} keystrokes); {hits}/{queries} misspelled names found")
+    print(f"Search index over {count} patients built in {built:.2f}s")
+    return results
+
+
+# SEARCH EXECUTOR (queries run on a worker thread; a newer query cancels the one in flight)
+SEARCH_CHUNK_SIZE = 50  # Result rows per UI event
+
+
+class SearchRequest:
+    __slots__ = ('serial', 'run', 'cancelled')
+
+    def __init__(self, serial, run):
+        self.serial = serial
+        self.run = run
+        self.cancelled = False
+
+
+class SearchExecutor:
+    """One search worker thread: submit() cancels whatever is queued or running"""
+
+    def __init__(self, publish, chunk_size=SEARCH_CHUNK_SIZE, history=200):
+        self._publish = publish  # publish(serial, rows, done, seconds) from the worker thread
+        self.chunk_size = chunk_size
+        self.timings = deque(maxlen=history)  # Seconds taken by recent finished queries
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._serial = 0
+        self._pending = None
+        self._current = None
+        self._thread = threading.Thread(target=self._run, name="search", daemon=True)
+        self._thread.start()
+
+    def submit(self, run):
+        """Queue run(cancelled) -> iterable of results; returns the query's serial"""
+        with self._lock:
+            self._cancel_locked()
+            self._serial += 1
+            self._pending = SearchRequest(self._serial, run)
+            serial = self._serial
+        self._wake.set()
+        return serial
+
+    def cancel(self):
+        """Drop the queued and running queries"""
+        with self._lock:
+            self._cancel_locked()
+
+    def _cancel_locked(self):
+        for request in (self._pending, self._current):
+            if request is not None:
+                request.cancelled = True
+        self._pending = None
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                self._wake.clear()
+                request, self._pending = self._pending, None
+                self._current = request
+            if request is not None:
+                self._execute(request)
+
+    def _execute(self, request):
+        started = time.perf_counter()
+        chunk = []
+        try:
+            for result in request.run(lambda: request.cancelled):
+                if request.cancelled:
+                    return
+                chunk.append(result)
+                if len(chunk) >= self.chunk_size:
+                    # Stream what is ready; the Tk thread inserts it on the next bus drain
+                    self._publish(request.serial, chunk, False, None)
+                    chunk = []
+        except Exception as e:
+            print(f"Search error: {e}")
+        if request.cancelled:
+            return
+        elapsed = time.perf_counter() - started
+        self.timings.append(elapsed)
+        self._publish(request.serial, chunk, True, elapsed)
+
+    def percentile(self, fraction):
+        """Query time below which `fraction` of recent queries finished"""
+        ordered = sorted(self.timings)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+
+# FILTER EXPRESSIONS ("procedure:MRI date:2025-06-01..2025-06-30 reminders:off phone:555")
+FILTER_FIELDS = ('id', 'name', 'procedure', 'phone', 'email', 'date', 'reminders', 'notes')
+FILTER_TOKEN = re.compile(r'(?:(\w+):)?("[^"]*"|\S+)')
+FILTER_SWITCHES = {'on': True, 'yes': True, 'true': True, 'off': False, 'no': False, 'false': False}
+
+
+class FilterSyntaxError(ValueError):
+    """A filter expression that cannot be understood"""
+
+
+def looks_like_filter(text):
+    """True if text has at least one known field:value term"""
+    return any(field.lower() in FILTER_FIELDS for field, _ in FILTER_TOKEN.findall(text) if field)
+
+
+def _filter_date(value):
+    if value.lower() in ('today', 'tomorrow'):
+        day = date.today() + timedelta(days=value.lower() == 'tomorrow')
+        return day.strftime('%Y-%m-%d')
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise FilterSyntaxError(f"Bad date '{value}' (use YYYY-MM-DD, today or tomorrow)") from None
+
+
+class AppointmentFilter:
+    """Parsed filter expression, answered from the book's indexes before any per-record test"""
+
+    # Terms are field:value (quote values with spaces) or bare words matched like live search.
+    # date:a..b uses the sorted date index, id: and procedure:<category> the hash indexes;
+    # indexed candidate sets are intersected smallest first. Every other term is a residual
+    # test on the records left, as is an indexed term whose set is far bigger than them.
+
+    def __init__(self, text):
+        self.text = text
+        self.terms = []  # (field or None for free text, parsed value)
+        for field, value in FILTER_TOKEN.findall(text):
+            value = value.strip('"')
+            if not value.strip():
+                raise FilterSyntaxError(f"Empty value in '{field + ':' if field else ''}\"\"' (quote some text)")
+            if not field:
+                self.terms.append((None, value.lower()))
+                continue
+            field = field.lower()
+            if field not in FILTER_FIELDS:
+                raise FilterSyntaxError(f"Unknown filter '{field}:' (use {', '.join(FILTER_FIELDS)})")
+            self.terms.append((field, self._parse(field, value)))
+
+    @staticmethod
+    def _parse(field, value):
+        if field == 'id':
+            if not value.isdigit():
+                raise FilterSyntaxError(f"id: needs a number, not '{value}'")
+            return int(value)
+        if field == 'date':
+            start, _, end = value.partition('..')
+            if '..' not in value:
+                end = start
+            return (_filter_date(start) if start else '0000-00-00',
+                    _filter_date(end) if end else '9999-12-31')
+        if field == 'reminders':
+            if value.lower() not in FILTER_SWITCHES:
+                raise FilterSyntaxError(f"reminders: is on or off, not '{value}'")
+            return FILTER_SWITCHES[value.lower()]
+        if field == 'phone':
+            return phone_digits(value) or value.lower()
+        return value.lower()
+
+    @staticmethod
+    def _lookup(field, value, indexes):
+        """(estimated size, ids) for a term the indexes answer exactly, or None"""
+        if field == 'id':
+            return 1, lambda: {value}
+        if field == 'date':
+            return indexes.count_between(*value), lambda: set(indexes.ids_between(*value))
+        if field == 'procedure':
+            counts = indexes.procedure_counts()
+            categories = [category for category in counts if category.lower() == value]
+            if categories:
+                return (sum(counts[category] for category in categories),
+                        lambda: set().union(*(indexes.ids_for_procedure(category) for category in categories)))
+        return None
+
+    @staticmethod
+    def _predicate(field, value, categories):
+        """Test one record against a term"""
+        if field is None:
+            digits = phone_digits(value) if re.fullmatch(r'[\d\s+()\-.]+', value) else ''
+            return lambda apt: SearchIndex.rank(apt, value, digits) is not None
+        if field == 'id':
+            return lambda apt: apt['id'] == value
+        if field == 'name':
+            return lambda apt: value in apt.search_name
+        if field == 'procedure':
+            if categories:
+                return lambda apt: procedure_category(apt.get('procedure')).lower() == value
+            return lambda apt: value in apt.search_procedure
+        if field == 'phone':
+            if value.isdigit():
+                return lambda apt: value in phone_digits(apt.get('phone_number'))
+            return lambda apt: value in (apt.get('phone_number') or '').lower()
+        if field == 'email':
+            return lambda apt: value in (apt.get('email') or '').lower()
+        if field == 'date':
+            return lambda apt: value[0] <= (apt.get('appointment_date') or '') <= value[1]
+        if field == 'reminders':
+            return lambda apt: bool(apt.get('enable_reminders', True)) == value
+        return lambda apt: value in apt.search_notes
+
+    def _seed(self, search_index):
+        """Superset of the matches from the search postings, for queries with no indexed term"""
+        # Only name: and phone: terms qualify: every name/phone substring of 3+ characters is
+        # covered by trigram postings. Free text also matches notes mid-word, which the word
+        # postings do not cover, so it is left to the full scan.
+        for field, value in self.terms:
+            if field == 'name' and len(value.strip()) >= 3:
+                return search_index.candidates(value)[0]
+            if field == 'phone' and value.isdigit() and len(value) >= 3:
+                return search_index.phone_candidates(value)
+        return None
+
+    def _indexed(self, indexes):
+        """Candidate ids from the indexed terms, and the positions of the terms still to test"""
+        lookups = []
+        for position, (field, value) in enumerate(self.terms):
+            lookup = self._lookup(field, value, indexes)
+            if lookup:
+                lookups.append((lookup[0], position, lookup[1]))
+        candidates, residual = None, set(range(len(self.terms)))
+        for estimate, position, ids in sorted(lookups, key=lambda lookup: lookup[0]):
+            if candidates is not None and (not candidates or estimate > 4 * len(candidates)):
+                continue  # Testing the few records left is cheaper than building this set
+            candidates = ids() if candidates is None else candidates & ids()
+            residual.discard(position)
+        return candidates, sorted(residual)
+
+    def run(self, book, search_index=None, cancelled=None):
+        """Matching appointments, oldest first"""
+        records = book.snapshot()
+        candidates, residual = book.index_lookup(self._indexed)
+        if candidates is None and search_index is not None:
+            candidates = self._seed(search_index)
+        categories = book.index_lookup(lambda indexes: set(indexes.procedure_counts()))
+        tests = []
+        for field, value in (self.terms[position] for position in residual):
+            matching = [category for category in categories if category.lower() == value] if field == 'procedure' else []
+            tests.append(self._predicate(field, value, matching))
+        matches = []
+        ids = sorted(candidates) if candidates is not None else records
+        for checked, apt_id in enumerate(ids):
+            if cancelled and not checked % 1024 and cancelled():
+                return []
+            appointment = records.get(apt_id)
+            if appointment is not None and all(test(appointment) for test in tests):
+                matches.append(appointment)
+        return matches
+
+
+# SORT ORDERS (cached sort keys and per-column sorted permutations, patched per change)
+class AppointmentSorter:
+    """Sorted id permutations per column, kept in step with the book instead of re-sorted"""
+
+    # A built column keeps a sorted list of (key..., id) tuples; the trailing id makes every
+    # entry unique, so an edit is one bisect removal plus one insort and a re-sort is just a
+    # walk over the list. Columns are built the first time they are sorted on.
+
+    KEYS = {
+        'ID': lambda apt: (apt['id'],),
+        'Name': lambda apt: ((apt.get('patient_name') or '').casefold(), apt['id']),
+        'Procedure': lambda apt: ((apt.get('procedure') or '').casefold(), apt['id']),
+        'DateTime': lambda apt: (apt.datetime or datetime.max, apt['id']),
+        'WhatsApp': lambda apt: (not apt.get('enable_reminders', True), apt['id']),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}  # id -> appointment
+        self._orders = {}  # column -> sorted key tuples
+        self._keys = {}  # column -> {id: key tuple}
+
+    # Book listener hooks (called under the book's lock)
+    def appointments_loaded(self, appointments):
+        with self._lock:
+            self._records = {appointment['id']: appointment for appointment in appointments}
+            self._orders, self._keys = {}, {}
+
+    def appointment_added(self, appointment):
+        with self._lock:
+            self._records[appointment['id']] = appointment
+            for column in self._orders:
+                self._insert(column, appointment)
+
+    def appointment_updated(self, appointment):
+        with self._lock:
+            apt_id = appointment['id']
+            self._records[apt_id] = appointment
+            for column in self._orders:
+                if self.KEYS[column](appointment) != self._keys[column].get(apt_id):
+                    self._discard(column, apt_id)
+                    self._insert(column, appointment)
+
+    def appointment_removed(self, apt_id):
+        with self._lock:
+            self._records.pop(apt_id, None)
+            for column in self._orders:
+                self._discard(column, apt_id)
+
+    def _insert(self, column, appointment):
+        key = self.KEYS[column](appointment)
+        self._keys[column][appointment['id']] = key
+        bisect.insort(self._orders[column], key)
+
+    def _discard(self, column, apt_id):
+        key = self._keys[column].pop(apt_id, None)
+        if key is None:
+            return
+        order = self._orders[column]
+        i = bisect.bisect_left(order, key)
+        if i < len(order) and order[i] == key:
+            del order[i]
+
+    def order(self, column, descending=False):
+        """All ids sorted by column"""
+        with self._lock:
+            if column not in self._orders:
+                keys = self._keys[column] = {apt_id: self.KEYS[column](appointment)
+                                             for apt_id, appointment in self._records.items()}
+                self._orders[column] = sorted(keys.values())
+            order = self._orders[column]
+            return [key[-1] for key in (reversed(order) if descending else order)]
+
+
+def check_appointment_filters(count=20000, seed=11):
+    """Compare filter expressions and live search with a brute-force scan over `count` synthetic appointments"""
+    rng = random.Random(seed)
+    procedures = ("MRI: Knee", "MRI", "CT: Chest", "X-Ray: Hand", "Consultation mri review")
+    notes = ("", "", "paracetamol twice daily", "knee pain", "urgent", "allergic to contrast")
+    start = date(2025, 1, 1)
+    book, index = AppointmentBook(), SearchIndex()
+    book.add_listener(index)
+    book.load([
+        Appointment(id=n, patient_name=f"{rng.choice(('Mohammed', 'Sarah', 'John'))} "
+                                       f"{rng.choice(('Smith', 'Khan', 'Lee'))} {n}",
+                    procedure=rng.choice(procedures), phone_number=f"+1 555-{rng.randrange(10000):04d}",
+                    email=f"patient{n}@example.com", notes=rng.choice(notes),
+                    appointment_date=(start + timedelta(days=rng.randrange(365))).strftime('%Y-%m-%d'),
+                    appointment_time="09:00", enable_reminders=rng.random() < 0.8)
+        for n in range(1, count + 1)
+    ])
+    def in_june(apt):
+        return '2025-06-01' <= apt['appointment_date'] <= '2025-06-30'
+    cases = [
+        ("tamol", lambda apt: 'tamol' in apt.search_notes),
+        ("date:2025-06-01..2025-06-30 tamol", lambda apt: in_june(apt) and 'tamol' in apt.search_notes),
+        ("procedure:MRI date:2025-06-01..2025-06-30 reminders:off phone:555",
+         lambda apt: procedure_category(apt['procedure']) == 'MRI' and in_june(apt)
+         and not apt['enable_reminders']),
+        ("procedure:knee", lambda apt: 'knee' in apt.search_procedure),
+        ("date:..2025-01-05 smith", lambda apt: apt['appointment_date'] <= '2025-01-05'
+         and 'smith' in apt.search_name),
+        ("phone:555-12", lambda apt: '55512' in phone_digits(apt['phone_number'])),
+        ('name:"khan 1"', lambda apt: 'khan 1' in apt.search_name),
+        ("name:ohn", lambda apt: 'ohn' in apt.search_name),
+        ("reminders:off notes:urgent", lambda apt: not apt['enable_reminders'] and 'urgent' in apt.search_notes),
+        ("id:42 mri", lambda apt: apt['id'] == 42 and 'mri' in apt.search_procedure),
+        ("email:patient7@", lambda apt: 'patient7@' in apt['email']),
+    ]
+    problems = []
+    for text, matches in cases:
+        got = [apt['id'] for apt in AppointmentFilter(text).run(book, index)]
+        expected = [apt['id'] for apt in book if matches(apt)]
+        if got != expected:
+            problems.append(f"{text!r}: {len(got)} matches, brute force found {len(expected)}")
+    for text in ('"   "', 'name:" "', "foo:bar", "date:2025-13-01", "reminders:maybe", "id:x"):
+        try:
+            AppointmentFilter(text)
+            problems.append(f"{text!r} was accepted")
+        except FilterSyntaxError:
+            pass
+    # Live search must find at least what the old scan over name, phone, procedure and notes found
+    terms = ("tamol", "cetam", "55", "07", "k", "mri", "-12", "5-0", "ohn 1", "daily")
+    for term in terms:
+        got = {apt['id'] for apt in index.search(term, limit=count)}
+        missing = [apt['id'] for apt in book
+                   if (term in apt.search_name or term in apt['phone_number'] or term in apt.search_procedure
+                       or term in apt.search_notes) and apt['id'] not in got]
+        if missing:
+            problems.append(f"search {term!r} missed {len(missing)} record(s) the old scan found")
+    print(f"Filter check: {len(cases)} queries and {len(terms)} searches against {count} appointments - "
+          f"{len(problems)} problem(s)" + (f", first: {problems[0]}" if problems else ""))
+    return problems
+
+
+# APPOINTMENT STORAGE - SQLite backend (one row per record, no whole-file rewrites)
+DATA_DB_FILE = 'clinic_data.db'
+LEDGER_FIELDS = ('apt_id', 'reminder_type', 'channel', 'status', 'at', 'apt_date')
+
+
+def legacy_ledger_rows(sent_reminders):
+    """Delivery ledger rows for old "<id>_<type>" sent keys"""
+    # The old keys did not say which channel got through, so count both as
+    # sent rather than risk sending the patient the same reminder twice
+    rows = []
+    for key, sent_at in sent_reminders.items():
+        apt_id, _, reminder_type = str(key).partition('_')
+        try:
+            apt_id = int(apt_id)
+        except ValueError:
+            continue
+        for channel in ("whatsapp", "email"):
+            rows.append({'apt_id': apt_id, 'reminder_type': reminder_type, 'channel': channel,
+                         'status': 'sent', 'at': sent_at, 'apt_date': ''})
+    return rows
+
+
+STORAGE_BACKENDS = ("sqlite", "journal")  # journal: appointments.json snapshot + JSON Lines journal
+STORAGE_BACKEND = "sqlite"  # Default; pick another per run with --storage
+
+
+class SQLiteAppointmentStore:
+    """SQLite-backed store for appointments, the delivery ledger and the outbox"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS appointments (
+            row_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER NOT NULL,
+            patient_name TEXT,
+            phone_number TEXT,
+            appointment_date TEXT,
+            appointment_time TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_appointments_id ON appointments(id);
+        CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments(appointment_date);
+        CREATE INDEX IF NOT EXISTS idx_appointments_phone ON appointments(phone_number);
+        CREATE TABLE IF NOT EXISTS delivery_ledger (
+            row_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            apt_id INTEGER NOT NULL,
+            reminder_type TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            status TEXT NOT NULL,
+            at TEXT,
+            apt_date TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_ledger_key ON delivery_ledger(apt_id, reminder_type, channel);
+        CREATE TABLE IF NOT EXISTS outbox (
+            message_id TEXT PRIMARY KEY,
+            channel TEXT NOT NULL,
+            apt_id INTEGER,
+            reminder_type TEXT,
+            reminder_key TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt TEXT,
+            last_error TEXT,
+            created_at TEXT
+        );
+    """
+
+    OUTBOX_COLUMNS = ('message_id', 'channel', 'apt_id', 'reminder_type', 'reminder_key',
+                      'attempts', 'next_attempt', 'last_error', 'created_at')
+
+    def __init__(self, db_path=DATA_DB_FILE):
+        self.db_path = db_path
+        # The reminder thread and the Tk thread share one connection, guarded by a lock
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self._lock, self.conn:
+            self.conn.executescript(self.SCHEMA)
+
+    def _row_values(self, appointment):
+        """Indexed columns plus the full JSON document for one appointment"""
+        return (
+            appointment['id'],
+            appointment.get('patient_name', ''),
+            appointment.get('phone_number', ''),
+            appointment.get('appointment_date', ''),
+            appointment.get('appointment_time', ''),
+            json.dumps(appointment, default=str)
+        )
+
+    def get_meta(self, key, default=None):
+        """Read a value from the meta table"""
+        with self._lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        """Write a value to the meta table"""
+        with self._lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    # Appointments
+    def load_appointments(self):
+        """Load all appointments in insertion order"""
+        with self._lock:
+            rows = self.conn.execute('SELECT data FROM appointments ORDER BY row_id').fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def _insert_rows(self, rows):
+        self.conn.executemany(
+            'INSERT INTO appointments (id, patient_name, phone_number, appointment_date, '
+            'appointment_time, data) VALUES (?, ?, ?, ?, ?, ?)',
+            rows
+        )
+
+    def _upsert_row(self, values):
+        cursor = self.conn.execute(
+            'UPDATE appointments SET patient_name = ?, phone_number = ?, appointment_date = ?, '
+            'appointment_time = ?, data = ? WHERE id = ?',
+            values[1:] + (values[0],)
+        )
+        if cursor.rowcount == 0:
+            self._insert_rows([values])
+
+    # Delivery ledger (append-only; the newest row per appointment/type/channel wins)
+    def _insert_ledger(self, rows):
+        self.conn.executemany(
+            f'INSERT INTO delivery_ledger ({", ".join(LEDGER_FIELDS)}) '
+            f'VALUES ({", ".join("?" * len(LEDGER_FIELDS))})',
+            [tuple(row.get(field) for field in LEDGER_FIELDS) for row in rows]
+        )
+
+    def load_ledger(self):
+        """Return every ledger row, oldest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                f'SELECT {", ".join(LEDGER_FIELDS)} FROM delivery_ledger ORDER BY row_id'
+            ).fetchall()
+        return [dict(zip(LEDGER_FIELDS, row)) for row in rows]
+
+    def append_ledger(self, rows):
+        """Append delivery outcomes"""
+        with self._lock, self.conn:
+            self._insert_ledger(rows)
+
+    def prune_ledger(self, keys):
+        """Delete every row for the given (apt_id, reminder_type, channel) keys"""
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'DELETE FROM delivery_ledger WHERE apt_id = ? AND reminder_type = ? AND channel = ?',
+                list(keys)
+            )
+
+    def apply_changes(self, appointments, full=None, meta=None):
+        """Apply a batch of tracked changes in one transaction; returns bytes written"""
+        written = 0
+        with self._lock, self.conn:
+            for key, value in (meta or {}).items():
+                self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+            if full:
+                rows = [self._row_values(apt) for apt in full]
+                self.conn.execute('DELETE FROM appointments')
+                self._insert_rows(rows)
+                written += sum(len(row[-1]) for row in rows)
+
+            for apt_id, appointment in appointments.items():
+                if appointment is None:
+                    self.conn.execute('DELETE FROM appointments WHERE id = ?', (apt_id,))
+                    continue
+                values = self._row_values(appointment)
+                self._upsert_row(values)
+                written += len(values[-1])
+        return written
+
+    # Outbox (written straight away, not through the background writer)
+    def load_outbox(self):
+        """Return every pending outbox message, earliest attempt first"""
+        with self._lock:
+            rows = self.conn.execute(
+                f'SELECT {", ".join(self.OUTBOX_COLUMNS)} FROM outbox ORDER BY next_attempt'
+            ).fetchall()
+        return [dict(zip(self.OUTBOX_COLUMNS, row)) for row in rows]
+
+    def save_outbox(self, entry):
+        """Insert or update one outbox message"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                f'INSERT OR REPLACE INTO outbox ({", ".join(self.OUTBOX_COLUMNS)}) '
+                f'VALUES ({", ".join("?" * len(self.OUTBOX_COLUMNS))})',
+                tuple(entry.get(column) for column in self.OUTBOX_COLUMNS)
+            )
+
+    def delete_outbox(self, message_id):
+        """Remove a delivered or abandoned outbox message"""
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM outbox WHERE message_id = ?', (message_id,))
+
+    def migrate_from_json(self, appointments_file='appointments.json',
+                          sent_file='sent_whatsapp_reminders.json'):
+        """One-shot import of the legacy JSON files into the database"""
+        if self.get_meta('migrated_from_json'):
+            return False
+
+        appointments = load_json_state(appointments_file, [])
+        sent_reminders = load_json_state(sent_file, {})
+
+        with self._lock, self.conn:
+            self._insert_rows([self._row_values(apt) for apt in appointments])
+            self._insert_ledger(legacy_ledger_rows(sent_reminders))
+            self.conn.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                ('migrated_from_json', datetime.now().isoformat())
+            )
+        return True
+
+    def checkpoint(self):
+        """Fold the WAL file back into the main database file"""
+        with self._lock:
+            self.conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self.conn.close()
+
+
+# APPOINTMENT STORAGE - JSON snapshot + append-only journal backend
+JOURNAL_COMPACT_BYTES = 512 * 1024  # Rewrite the snapshot once the journal passes this size
+
+
+class JournaledJSONStore:
+    """Plain-file store: appointments.json snapshot plus a JSON Lines journal of mutations"""
+
+    def __init__(self, appointments_file='appointments.json',
+                 sent_file='sent_whatsapp_reminders.json',
+                 journal_file='appointments.journal.jsonl',
+                 outbox_file='reminder_outbox.json',
+                 ledger_file='delivery_ledger.json',
+                 compact_bytes=JOURNAL_COMPACT_BYTES):
+        self.appointments_file = appointments_file
+        self.sent_file = sent_file  # Legacy sent keys, read once to seed the ledger
+        self.ledger_file = ledger_file
+        self.outbox_file = outbox_file
+        self.journal_file = journal_file
+        self.compact_bytes = compact_bytes
+        self.meta_file = os.path.splitext(appointments_file)[0] + '.meta.json'
+        self._lock = threading.RLock()
+        self._appointments = {}  # id -> appointment, in snapshot/insertion order
+        self._ledger = {}  # "apt_id|type|channel" -> newest ledger row
+        self._meta = {}
+        self._outbox = {}
+        self._load()
+        self._journal = open(self.journal_file, 'a', encoding='utf-8')
+
+    def _load(self):
+        """Load the last snapshot and replay the journal tail on top of it"""
+        for i, apt in enumerate(load_json_state(self.appointments_file, [])):
+            # Legacy files can hold duplicate ids; keep every record
+            key = apt['id'] if apt['id'] not in self._appointments else (apt['id'], i)
+            self._appointments[key] = apt
+        if os.path.exists(self.ledger_file):
+            ledger_rows = load_json_state(self.ledger_file, [])
+        else:
+            ledger_rows = legacy_ledger_rows(load_json_state(self.sent_file, {}))
+        for row in ledger_rows:
+            self._replay({'op': 'ledger', 'row': row})
+        self._meta = load_json_state(self.meta_file, {})
+        self._outbox = load_json_state(self.outbox_file, {})
+        if os.path.exists(self.journal_file):
+            good_bytes = 0
+            with open(self.journal_file, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError("incomplete line")
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self._replay(entry)
+                    good_bytes += len(line)
+                torn = f.seek(0, os.SEEK_END) > good_bytes
+            if torn:
+                # Drop a torn tail from a crash mid-append so new records start on a clean line
+                with open(self.journal_file, 'r+b') as f:
+                    f.truncate(good_bytes)
+
+    @staticmethod
+    def _ledger_key(apt_id, reminder_type, channel):
+        return f"{apt_id}|{reminder_type}|{channel}"
+
+    def _replay(self, entry):
+        op = entry.get('op')
+        if op == 'put':
+            self._appointments[entry['id']] = entry['apt']
+        elif op == 'del':
+            self._appointments.pop(entry['id'], None)
+        elif op == 'ledger':
+            row = entry['row']
+            self._ledger[self._ledger_key(row['apt_id'], row['reminder_type'], row['channel'])] = row
+        elif op == 'ledger_prune':
+            for key in entry['keys']:
+                self._ledger.pop(self._ledger_key(*key), None)
+        elif op == 'meta':
+            self._meta[entry['key']] = entry['value']
+        elif op == 'outbox':
+            self._outbox[entry['entry']['message_id']] = entry['entry']
+        elif op == 'outbox_done':
+            self._outbox.pop(entry['id'], None)
+
+    def load_appointments(self):
+        """Return all appointments in order"""
+        with self._lock:
+            return [dict(apt) for apt in self._appointments.values()]
+
+    def load_ledger(self):
+        """Return the newest ledger row per appointment/type/channel"""
+        with self._lock:
+            return [dict(row) for row in self._ledger.values()]
+
+    def append_ledger(self, rows):
+        """Journal delivery outcomes"""
+        with self._lock:
+            entries = [{'op': 'ledger', 'row': dict(row)} for row in rows]
+            for entry in entries:
+                self._replay(entry)
+            self._append(entries)
+
+    def prune_ledger(self, keys):
+        """Forget every row for the given (apt_id, reminder_type, channel) keys"""
+        with self._lock:
+            entry = {'op': 'ledger_prune', 'keys': [list(key) for key in keys]}
+            self._replay(entry)
+            self._append([entry])
+
+    def get_meta(self, key, default=None):
+        """Read a stored bookkeeping value"""
+        with self._lock:
+            return self._meta.get(key, default)
+
+    def apply_changes(self, appointments, full=None, meta=None):
+        """Append one journal record per change; returns bytes written"""
+        with self._lock:
+            if full:
+                self._appointments = {apt['id']: apt for apt in full}
+
+            entries = [{'op': 'meta', 'key': key, 'value': value} for key, value in (meta or {}).items()]
+            for apt_id, appointment in appointments.items():
+                if appointment is None:
+                    entries.append({'op': 'del', 'id': apt_id})
+                else:
+                    entries.append({'op': 'put', 'id': apt_id, 'apt': appointment})
+            for entry in entries:
+                self._replay(entry)
+
+            if full:
+                return self.compact()
+            return self._append(entries)
+
+    def _append(self, entries):
+        """Write and fsync journal records, compacting once the journal is large"""
+        data = ''.join(json.dumps(entry, default=str) + '\n' for entry in entries)
+        self._journal.write(data)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        written = len(data.encode('utf-8'))
+
+        if self._journal.tell() >= self.compact_bytes:
+            written += self.compact()
+        return written
+
+    # Outbox (journaled straight away, not through the background writer)
+    def load_outbox(self):
+        """Return every pending outbox message, earliest attempt first"""
+        with self._lock:
+            return sorted((dict(entry) for entry in self._outbox.values()),
+                          key=lambda entry: entry.get('next_attempt') or '')
+
+    def save_outbox(self, entry):
+        """Insert or update one outbox message"""
+        with self._lock:
+            record = {'op': 'outbox', 'entry': dict(entry)}
+            self._replay(record)
+            self._append([record])
+
+    def delete_outbox(self, message_id):
+        """Remove a delivered or abandoned outbox message"""
+        with self._lock:
+            record = {'op': 'outbox_done', 'id': message_id}
+            self._replay(record)
+            self._append([record])
+
+    def compact(self):
+        """Rewrite the snapshot files from memory and start an empty journal"""
+        with self._lock:
+            with AtomicFileBatch() as batch:
+                written = batch.write_json(self.appointments_file, list(self._appointments.values()))
+                written += batch.write_json(self.ledger_file, list(self._ledger.values()))
+                written += batch.write_json(self.meta_file, self._meta)
+                written += batch.write_json(self.outbox_file, self._outbox)
+            # Replaying put/del/ledger/outbox is idempotent, so a crash before this
+            # truncate only means the old tail is applied twice on startup
+            self._journal.close()
+            self._journal = open(self.journal_file, 'w', encoding='utf-8')
+            return written
+
+    def migrate_from_json(self, *args, **kwargs):
+        """The legacy files are this backend's native format; nothing to migrate"""
+        return False
+
+    def checkpoint(self):
+        """Fold the journal into the snapshot"""
+        self.compact()
+
+    def close(self):
+        """Close the journal file"""
+        with self._lock:
+            self._journal.close()
+
+
+def open_appointment_store():
+    """Open the storage backend selected by STORAGE_BACKEND"""
+    if STORAGE_BACKEND == "journal":
+        return JournaledJSONStore()
+    return SQLiteAppointmentStore(DATA_DB_FILE)
+
+
+# REMINDER LOG (buffered JSON Lines on a background thread, rotated into dated segments)
+REMINDER_LOG_FILE = 'reminder_log.jsonl'
+LEGACY_LOG_FILE = 'whatsapp_reminder_log.txt'
+LOG_MAX_BYTES = 8 * 1024 * 1024  # Rotate the active segment at this size ...
+LOG_BACKUPS = 60  # ... keeping this many older segments
+LOG_COMPRESS = False  # gzip rotated segments (smaller, but paged reads must decompress them)
+LOG_INDEX_SPARSE = 256  # Keep the timestamp of every Nth line for date seeks
+LOG_PAGE_SIZE = 100  # Entries per page in the log viewer
+
+
+def read_legacy_log_text(path):
+    """Rows of the old "a | b | c | d | e" text log"""
+    rows = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.rstrip('\n').split(' | ')
+            if len(parts) >= 5:
+                rows.append(tuple(parts[:4]) + (' | '.join(parts[4:]),))
+    return rows
+
+
+class LogSegmentIndex:
+    """Line offsets of one log segment plus patient/phone/status postings and sparse timestamps"""
+
+    KEYS = ('patient', 'phone', 'status')
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.sealed = False  # Rotated segment whose sidecar is current; never re-read
+        self.reset()
+
+    def reset(self):
+        self.size = 0  # Bytes indexed so far, always ending on a line boundary
+        self.offsets = array('Q')  # Start of every readable line
+        self.postings = {key: {} for key in self.KEYS}  # key -> value -> ascending line numbers
+        self.timestamps = []  # (line number, timestamp) every LOG_INDEX_SPARSE lines
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @staticmethod
+    def normalize(key, value):
+        """Patients and statuses match case-insensitively, phones on their digits"""
+        value = str(value or '')
+        if key == 'phone':
+            return re.sub(r'\D', '', value) or value
+        return value.lower()
+
+    @staticmethod
+    def sidecar_path(path):
+        return path + '.idx'
+
+    @contextlib.contextmanager
+    def view(self):
+        """The segment's bytes: an mmap for plain files, decompressed bytes for .gz"""
+        if self.path.endswith('.gz'):
+            with gzip.open(self.path, 'rb') as f:
+                yield f.read()
+            return
+        with open(self.path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                yield b''
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield data
+
+    def update(self):
+        """Index the complete lines appended since the last call"""
+        with self.view() as data:
+            size = len(data)
+            if size < self.size:
+                self.reset()  # Truncated or replaced underneath us: start over
+            end = data.rfind(b'\n', self.size, size) + 1 if size > self.size else 0
+            if end <= self.size:
+                return False
+            position = self.size
+            for line in data[self.size:end].split(b'\n')[:-1]:
+                self._add(position, line)
+                position += len(line) + 1
+            self.size = end
+        return True
+
+    def _add(self, position, line):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return  # Torn line from a crash mid-write
+        if not isinstance(record, dict):
+            return
+        number = len(self.offsets)
+        self.offsets.append(position)
+        for key in self.KEYS:
+            value = self.normalize(key, record.get(key))
+            numbers = self.postings[key].get(value)
+            if numbers is None:
+                numbers = self.postings[key][value] = array('I')
+            numbers.append(number)
+        if number % LOG_INDEX_SPARSE == 0:
+            self.timestamps.append((number, str(record.get('timestamp', ''))))
+
+    def line(self, data, number):
+        start = self.offsets[number]
+        end = data.find(b'\n', start)
+        return data[start:end if end >= 0 else len(data)]
+
+    def timestamp_at(self, data, number):
+        try:
+            return str(json.loads(self.line(data, number)).get('timestamp', ''))
+        except (ValueError, AttributeError):
+            return ''
+
+    def line_range(self, data, start='', end=''):
+        """Line numbers [lo, hi) with start <= timestamp <= end (entries are appended in time order)"""
+        lo, hi = 0, len(self.offsets)
+        # bisect's key= needs Python 3.10; the sample list is short, so search a plain copy of the times
+        times = [sample[1] for sample in self.timestamps]
+        if start:
+            # Jump to the last sampled line before `start`, then step over at most LOG_INDEX_SPARSE lines
+            mark = bisect.bisect_left(times, start)
+            lo = self.timestamps[mark - 1][0] if mark else 0
+            while lo < hi and self.timestamp_at(data, lo) < start:
+                lo += 1
+        if end:
+            mark = bisect.bisect_right(times, end)
+            hi = self.timestamps[mark][0] if mark < len(self.timestamps) else hi
+            while hi > lo and self.timestamp_at(data, hi - 1) > end:
+                hi -= 1
+        return lo, hi
+
+    def matching(self, data, filters, start='', end=''):
+        """Ascending line numbers matching every filter (substring per key) within the date range"""
+        lo, hi = self.line_range(data, start, end) if start or end else (0, len(self.offsets))
+        if lo >= hi:
+            return []
+        result = None
+        for key, text in sorted(filters.items()):
+            needle = self.normalize(key, text)
+            hits = [numbers for value, numbers in self.postings[key].items() if needle in value]
+            if not hits:
+                return []
+            lines = hits[0] if len(hits) == 1 else sorted(set().union(*hits))
+            if result is None:
+                result = lines
+            else:
+                keep = set(lines)
+                result = [number for number in result if number in keep]
+        if result is None:
+            return range(lo, hi)
+        if lo or hi < len(self.offsets):
+            result = result[bisect.bisect_left(result, lo):bisect.bisect_left(result, hi)]
+        return result
+
+    def _stamp(self):
+        stat = os.stat(self.path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def save(self):
+        """Write the sidecar: header length, JSON header, offsets, then every postings array"""
+        header = {'version': self.VERSION, 'stamp': self._stamp(), 'size': self.size,
+                  'count': len(self.offsets), 'timestamps': self.timestamps, 'postings': {}}
+        blob = array('I')
+        for key in self.KEYS:
+            spans = header['postings'][key] = {}
+            for value, numbers in self.postings[key].items():
+                spans[value] = (len(blob), len(numbers))
+                blob.extend(numbers)
+        encoded = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        temp_path = self.sidecar_path(self.path) + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(len(encoded).to_bytes(8, 'little'))
+            f.write(encoded)
+            self.offsets.tofile(f)
+            blob.tofile(f)
+        os.replace(temp_path, self.sidecar_path(self.path))
+        self.sealed = True
+
+    @classmethod
+    def load(cls, path):
+        """Index from the segment's sidecar, or None when it is missing or stale"""
+        index = cls(path)
+        try:
+            with open(cls.sidecar_path(path), 'rb') as f:
+                header = json.loads(f.read(int.from_bytes(f.read(8), 'little')))
+                if header.get('version') != cls.VERSION or header.get('stamp') != index._stamp():
+                    return None
+                index.offsets.fromfile(f, header['count'])
+                blob = array('I')
+                blob.frombytes(f.read())
+        except (OSError, ValueError, EOFError, KeyError):
+            return None
+        index.size = header['size']
+        index.timestamps = [tuple(sample) for sample in header['timestamps']]
+        for key in cls.KEYS:
+            index.postings[key] = {value: blob[first:first + length]
+                                   for value, (first, length) in header['postings'][key].items()}
+        index.sealed = True
+        return index
+
+
+class ReminderLogger:
+    """Reminder activity log: callers enqueue, a worker appends JSON Lines in batches"""
+
+    FIELDS = ('timestamp', 'patient', 'phone', 'activity', 'status')
+
+    def __init__(self, path=REMINDER_LOG_FILE, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS,
+                 compress=LOG_COMPRESS, flush_interval=1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()  # File access: writes and rotation vs. reads and clear
+        self._file = None
+        self._file_day = None
+        self._indexes = {}  # Segment path -> LogSegmentIndex, built on the first query
+        root, ext = os.path.splitext(os.path.basename(path))
+        self._segment_name = re.compile(rf'^{re.escape(root)}\.(\d{{8}}-\d{{12}}){re.escape(ext)}(\.gz)?$')
+        self._thread = threading.Thread(target=self._run, name="reminder-log", daemon=True)
+        self._thread.start()
+
+    def log(self, timestamp, patient, phone, activity, status):
+        """Queue one entry; never blocks on disk"""
+        self._queue.put(dict(zip(self.FIELDS, (timestamp, patient, phone, activity, status))))
+
+    def import_rows(self, rows):
+        """Queue (timestamp, patient, phone, activity, status) rows from an older log"""
+        for row in rows:
+            self.log(*row)
+
+    def flush(self, timeout=2.0):
+        """Wait until everything queued so far is on disk"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Take everything else already waiting and write it in one go
+            batch = [item]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [entry for entry in batch if isinstance(entry, dict)]
+            if records:
+                try:
+                    self._write(records)
+                except Exception as e:
+                    print(f"Reminder log write error: {e}")
+            for entry in batch:
+                if isinstance(entry, threading.Event):
+                    entry.set()
+                elif entry is None:
+                    self._close_file()
+                    return
+
+    def _open(self):
+        self._file = open(self.path, 'ab')
+        size = self._file.tell()
+        self._file_day = (datetime.fromtimestamp(os.path.getmtime(self.path)).date()
+                          if size else date.today())
+
+    def _close_file(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, records):
+        with self._lock:
+            if self._file is None:
+                self._open()
+            # Date-based rotation: each segment holds at most one day
+            if self._file.tell() and self._file_day != date.today():
+                self._rotate()
+            chunk = []
+            size = self._file.tell()
+            for record in records:
+                line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+                chunk.append(line)
+                size += len(line)
+                if size >= self.max_bytes:
+                    self._file.write(b''.join(chunk))
+                    self._rotate()
+                    chunk, size = [], 0
+            if chunk:
+                self._file.write(b''.join(chunk))
+            self._file.flush()
+
+    def _rotate(self):
+        """Move the active segment aside under a timestamped name and start an empty one"""
+        self._file.close()
+        self._file = None
+        root, ext = os.path.splitext(self.path)
+        target = f"{root}.{datetime.now().strftime('%Y%m%d-%H%M%S%f')}{ext}"
+        index = self._indexes.pop(self.path, None)
+        if self.compress:
+            target += '.gz'
+            with open(self.path, 'rb') as src, gzip.open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.path)
+        else:
+            # Same bytes under a new name, so the in-memory index carries over
+            os.replace(self.path, target)
+            if index is not None:
+                index.path = target
+                self._indexes[target] = index
+        for path in self._rotated_segments()[self.backups:]:
+            self._remove_segment(path)
+        self._open()
+
+    def _rotated_segments(self):
+        """Rotated segments, newest first (names sort by their rotation time)"""
+        directory = os.path.dirname(self.path) or '.'
+        matches = sorted(((match.group(1), name) for name in os.listdir(directory)
+                          for match in [self._segment_name.match(name)] if match), reverse=True)
+        return [os.path.join(os.path.dirname(self.path), name) for _, name in matches]
+
+    def _remove_segment(self, path):
+        self._indexes.pop(path, None)
+        for name in (path, LogSegmentIndex.sidecar_path(path)):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def segments(self):
+        """Log files from newest to oldest"""
+        return ([self.path] if os.path.exists(self.path) else []) + self._rotated_segments()
+
+    @staticmethod
+    def _read_reverse(path, block_size=64 * 1024):
+        """Yield the lines of a plain file from the last to the first, reading backwards"""
+        with open(path, 'rb') as f:
+            position = f.seek(0, os.SEEK_END)
+            tail = b''
+            while position > 0:
+                step = min(block_size, position)
+                position -= step
+                f.seek(position)
+                lines = (f.read(step) + tail).split(b'\n')
+                tail = lines.pop(0)  # May be the end of a line that starts in an earlier block
+                for line in reversed(lines):
+                    if line:
+                        yield line
+            if tail:
+                yield tail
+
+    def _decode(self, line):
+        try:
+            record = json.loads(line)
+            return tuple(str(record.get(field, '')) for field in self.FIELDS)
+        except (ValueError, AttributeError):
+            return None  # Torn line from a crash mid-write
+
+    def tail(self, limit=100):
+        """Newest `limit` entries, newest first, without reading whole files"""
+        rows = []
+        with self._lock:
+            for path in self.segments():
+                if path.endswith('.gz'):
+                    # Compressed segments cannot be read backwards; they are bounded by max_bytes
+                    with gzip.open(path, 'rb') as f:
+                        lines = reversed(deque(f, maxlen=limit - len(rows)))
+                else:
+                    lines = self._read_reverse(path)
+                for line in lines:
+                    row = self._decode(line)
+                    if row:
+                        rows.append(row)
+                        if len(rows) >= limit:
+                            return rows
+        return rows
+
+    def _index(self, path):
+        """Up-to-date index of one segment; rotated segments are indexed once and kept in a sidecar"""
+        index = self._indexes.get(path)
+        if index is None and path != self.path:
+            index = LogSegmentIndex.load(path)
+        if index is None:
+            index = LogSegmentIndex(path)
+        if not index.sealed:
+            index.update()
+            if path != self.path:
+                try:
+                    index.save()
+                except OSError as e:
+                    print(f"Reminder log index error: {e}")
+        self._indexes[path] = index
+        return index
+
+    def query(self, patient='', phone='', status='', day='', page=0, page_size=100):
+        """One page of entries (newest first) matching every given filter, and the total that match"""
+        filters = {key: value for key, value in (('patient', patient), ('phone', phone),
+                                                 ('status', status)) if value}
+        start, end = (day, day + '\uffff') if day else ('', '')
+        skip = page * page_size
+        rows, total = [], 0
+        with self._lock:
+            for path in self.segments():
+                index = self._index(path)
+                with (index.view() if day else contextlib.nullcontext(b'')) as data:
+                    numbers = index.matching(data, filters, start, end)
+                count = len(numbers)
+                total += count
+                if skip >= count:
+                    skip -= count
+                    continue
+                if len(rows) < page_size:
+                    # Walk this segment's matches backwards, reading only the lines on the page
+                    stop = max(count - skip - (page_size - len(rows)), 0)
+                    with index.view() as data:
+                        for position in range(count - 1 - skip, stop - 1, -1):
+                            row = self._decode(index.line(data, numbers[position]))
+                            if row:
+                                rows.append(row)
+                skip = 0
+        return rows, total
+
+    def clear(self):
+        """Delete every segment"""
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            for path in self.segments():
+                self._remove_segment(path)
+            self._indexes.clear()
+
+    def close(self, timeout=2.0):
+        """Write what is queued and stop the worker"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+# REMINDER SCHEDULER (heap of due reminders instead of rescanning every appointment)
+REMINDER_TYPES = ("3_days", "1_day", "morning", "1_hour")
+
+
+def reminder_windows(apt_datetime):
+    """[(reminder_type, due, expires)] for one appointment time"""
+    morning_due = apt_datetime.replace(hour=8, minute=0, second=0, microsecond=0)
+    morning_end = min(apt_datetime.replace(hour=10, minute=59, second=59, microsecond=0), apt_datetime)
+    windows = [
+        ("3_days", apt_datetime - timedelta(days=3), apt_datetime - timedelta(days=3) + timedelta(hours=6)),
+        ("1_day", apt_datetime - timedelta(days=1), apt_datetime - timedelta(days=1) + timedelta(hours=6)),
+        ("1_hour", apt_datetime - timedelta(hours=1), apt_datetime - timedelta(minutes=30))
+    ]
+    if morning_due < morning_end:
+        windows.insert(2, ("morning", morning_due, morning_end))
+    return windows
+
+
+CATCHUP_MIN_LEAD = timedelta(minutes=30)  # A late reminder this close to the visit is no longer useful
+
+
+def missed_reminders(book, since, now, min_lead=CATCHUP_MIN_LEAD):
+    """[(appointment, reminder_type)] whose window closed while the app was not running"""
+    # A window that was due before now belongs to a visit less than 3 days ahead,
+    # so the date index narrows the search to today .. today + 3 days
+    missed = []
+    for appointment in book.between(now.strftime('%Y-%m-%d'), (now + timedelta(days=3)).strftime('%Y-%m-%d')):
+        apt_datetime = appointment.datetime
+        if (not apt_datetime or apt_datetime - now < min_lead
+                or not appointment.get('enable_reminders', True)):
+            continue
+        overlapping = sorted((window for window in reminder_windows(apt_datetime)
+                              if window[1] < now and window[2] > since), key=lambda window: window[1])
+        if not overlapping:
+            continue
+        # Only the most recent reminder is worth sending late; if its window is
+        # still open the scheduler sends it as usual
+        reminder_type, _, expires = overlapping[-1]
+        if expires <= now:
+            missed.append((appointment, reminder_type))
+    return missed
+
+
+class ReminderScheduler:
+    """Min-heap of upcoming reminders; the reminder thread sleeps until the earliest is due"""
+
+    def __init__(self):
+        self._heap = []  # (due, expires, generation, apt_id, reminder_type)
+        self._generation = {}  # apt_id -> current plan generation; older heap entries are stale
+        self._times = {}  # apt_id -> visit time the current plan was made for
+        self._carried = {}  # apt_id -> {reminder_type: (due, expires)} of pending deferred/catch-up entries
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    # Book listener hooks (called on the Tk thread)
+    def appointments_loaded(self, appointments):
+        self.replan_all(appointments)
+
+    def appointment_added(self, appointment):
+        self.plan(appointment)
+
+    def appointment_updated(self, appointment):
+        self.plan(appointment)
+
+    def appointment_removed(self, apt_id):
+        self.unplan(apt_id)
+
+    def _push_plan(self, appointment, now):
+        apt_id = appointment['id']
+        generation = self._generation.get(apt_id, 0) + 1
+        self._generation[apt_id] = generation
+        self._carried.pop(apt_id, None)
+        apt_datetime = appointment.datetime
+        self._times[apt_id] = apt_datetime
+        if not apt_datetime or not appointment.get('enable_reminders', True):
+            return
+        for reminder_type, due, expires in reminder_windows(apt_datetime):
+            if expires > now:
+                heapq.heappush(self._heap, (due, expires, generation, apt_id, reminder_type))
+
+    def plan(self, appointment):
+        """(Re)compute the reminders of one appointment in O(log N)"""
+        with self._lock:
+            self._push_plan(appointment, datetime.now())
+        self._wake.set()
+
+    def unplan(self, apt_id):
+        """Forget an appointment; its heap entries are dropped lazily"""
+        with self._lock:
+            self._generation[apt_id] = self._generation.get(apt_id, 0) + 1
+            self._times.pop(apt_id, None)
+            self._carried.pop(apt_id, None)
+
+    def replan_all(self, appointments):
+        """Rebuild the heap (load, import), keeping deferred and catch-up reminders of unchanged visits"""
+        with self._lock:
+            carried, times = self._carried, self._times
+            self._heap, self._generation, self._times, self._carried = [], {}, {}, {}
+            now = datetime.now()
+            for appointment in appointments:
+                self._push_plan(appointment, now)
+                apt_id = appointment['id']
+                pending = carried.get(apt_id)
+                if (pending and appointment.get('enable_reminders', True)
+                        and times.get(apt_id) == appointment.datetime):
+                    for reminder_type, (due, expires) in pending.items():
+                        if expires > now:
+                            self._push_extra(apt_id, self._generation[apt_id], reminder_type, due, expires)
+        self._wake.set()
+
+    def _push_extra(self, apt_id, generation, reminder_type, due, expires):
+        heapq.heappush(self._heap, (due, expires, generation, apt_id, reminder_type))
+        if generation == self._generation.get(apt_id):
+            self._carried.setdefault(apt_id, {})[reminder_type] = (due, expires)
+
+    def add_catchup(self, apt_id, reminder_type, due, expires):
+        """Queue a one-off reminder outside the normal windows (startup catch-up)"""
+        with self._lock:
+            if apt_id not in self._times:
+                return  # Never planned, or removed since
+            self._push_extra(apt_id, self._generation[apt_id], reminder_type, due, expires)
+        self._wake.set()
+
+    def defer(self, event, due):
+        """Put a popped reminder back with a later due time"""
+        _, expires, generation, apt_id, reminder_type = event
+        with self._lock:
+            self._push_extra(apt_id, generation, reminder_type, due, expires)
+
+    def _drop_stale(self):
+        while self._heap and self._heap[0][2] != self._generation.get(self._heap[0][3]):
+            heapq.heappop(self._heap)
+
+    def next_due(self):
+        """Due time of the earliest live reminder, or None"""
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Remove and return every live reminder due at or before now"""
+        due_events = []
+        with self._lock:
+            self._drop_stale()
+            while self._heap and self._heap[0][0] <= now:
+                event = heapq.heappop(self._heap)
+                due, expires, generation, apt_id, reminder_type = event
+                if generation == self._generation.get(apt_id):
+                    due_events.append(event)
+                    pending = self._carried.get(apt_id)
+                    if pending and pending.get(reminder_type) == (due, expires):
+                        del pending[reminder_type]
+                        if not pending:
+                            del self._carried[apt_id]
+                self._drop_stale()
+        return due_events
+
+    def wait(self, timeout):
+        """Sleep until timeout or until the plan changes"""
+        self._wake.wait(timeout)
+        self._wake.clear()
+
+    def wake(self):
+        self._wake.set()
+
+    def __len__(self):
+        return len(self._heap)
+
+
+# REMINDER DISPATCH (one queue + worker per channel, paced by a token bucket)
+class TokenBucket:
+    """Allows one send per `interval` seconds, with bursts of up to `capacity`"""
+
+    def __init__(self, interval, capacity=1):
+        self._lock = threading.Lock()
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self.set_interval(interval)
+
+    def set_interval(self, interval):
+        with self._lock:
+            try:
+                self.interval = max(float(interval), 0.0)
+            except (TypeError, ValueError):
+                self.interval = 0.0
+
+    def take(self):
+        """Take a token if one is free and return 0, else the seconds until one will be"""
+        with self._lock:
+            now = time.monotonic()
+            if self.interval <= 0:
+                self._tokens = self.capacity
+            else:
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) / self.interval)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) * self.interval
+
+    def acquire(self, stop_event):
+        """Block until a token is free; False if stop_event was set meanwhile"""
+        while True:
+            wait = self.take()
+            if not wait:
+                return True
+            if stop_event.wait(wait):
+                return False
+
+
+class DispatchJob:
+    """One message waiting for a channel worker"""
+
+    __slots__ = ('channel', 'appointment', 'reminder_type', 'reminder_key', 'enqueued_at', 'error',
+                 'outbox_id')
+
+    def __init__(self, channel, appointment, reminder_type, reminder_key=None, outbox_id=None):
+        self.channel = channel
+        self.appointment = appointment
+        self.reminder_type = reminder_type
+        self.reminder_key = reminder_key
+        self.enqueued_at = None
+        self.error = None
+        self.outbox_id = outbox_id
+
+
+class ChannelDispatcher:
+    """Queue and worker thread(s) for one channel; scheduling never waits on sending"""
+
+    def __init__(self, channel, send, interval, on_result=None, workers=1, on_idle=None,
+                 send_batch=None, batch_size=1):
+        self.channel = channel
+        self.send = send
+        # send_batch(jobs) -> [True/False, ...]; used when more than one job is waiting
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.bucket = TokenBucket(interval)
+        self.on_result = on_result
+        self.on_idle = on_idle
+        self.queue = queue.Queue()
+        self.stats = {
+            "queued": 0,
+            "sent": 0,
+            "failed": 0,
+            "last_latency": 0.0,
+            "avg_latency": 0.0,
+            "max_latency": 0.0
+        }
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{channel}-dispatch-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job):
+        job.enqueued_at = time.monotonic()
+        self.stats["queued"] += 1
+        self.queue.put(job)
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                if self.on_idle:
+                    self.on_idle()
+                continue
+            jobs = [job]
+            while self.send_batch and len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            # Every message in a batch still spends its own token
+            if not all(self.bucket.acquire(self._stop) for _ in jobs):
+                break
+            if len(jobs) > 1:
+                try:
+                    results = [bool(success) for success in self.send_batch(jobs)]
+                except Exception as e:
+                    for job in jobs:
+                        job.error = str(e)
+                    results = [False] * len(jobs)
+            else:
+                try:
+                    results = [bool(self.send(job))]
+                except Exception as e:
+                    job.error = str(e)
+                    results = [False]
+            for job, success in zip(jobs, results):
+                self._record(job, success)
+
+    def _record(self, job, success):
+        # Latency covers the time spent waiting in the queue plus the send itself
+        latency = time.monotonic() - job.enqueued_at
+        self.stats["sent" if success else "failed"] += 1
+        self.stats["last_latency"] = latency
+        self.stats["max_latency"] = max(self.stats["max_latency"], latency)
+        self.stats["avg_latency"] = latency if not self.stats["avg_latency"] else (
+            0.8 * self.stats["avg_latency"] + 0.2 * latency)
+        if self.on_result:
+            self.on_result(job, success)
+
+    def stop(self):
+        self._stop.set()
+
+
+# REMINDER OUTBOX (pending sends persisted, failures retried with exponential backoff)
+class ReminderOutbox:
+    """Reminder messages stay in the store from first attempt until delivered or abandoned"""
+
+    def __init__(self, store, resend, max_attempts=6, base_delay=60, max_delay=3600):
+        self.store = store
+        self.resend = resend  # resend(entry), called on the retry thread once an entry is due
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._entries = {}  # message_id -> entry
+        self._heap = []  # (next_attempt iso string, message_id); stale items are skipped
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def message_id(reminder_key, channel):
+        return f"{reminder_key}:{channel}"
+
+    def resume(self):
+        """Load messages left pending by the last run and start the retry thread"""
+        with self._lock:
+            for entry in self.store.load_outbox():
+                self._entries[entry['message_id']] = entry
+                heapq.heappush(self._heap, (entry['next_attempt'], entry['message_id']))
+            pending = [dict(entry) for entry in self._entries.values()]
+        self._thread = threading.Thread(target=self._run, name="outbox-retry", daemon=True)
+        self._thread.start()
+        return pending
+
+    def add(self, channel, apt_id, reminder_type, reminder_key):
+        """Record a message before its first attempt, so a crash mid-send leaves it pending"""
+        now = datetime.now().isoformat()
+        entry = {
+            'message_id': self.message_id(reminder_key, channel),
+            'channel': channel,
+            'apt_id': apt_id,
+            'reminder_type': reminder_type,
+            'reminder_key': reminder_key,
+            'attempts': 0,
+            'next_attempt': now,
+            'last_error': None,
+            'created_at': now
+        }
+        with self._lock:
+            self._entries[entry['message_id']] = entry
+        self.store.save_outbox(entry)
+        return entry['message_id']
+
+    def backoff(self, attempts):
+        """Exponential delay with equal jitter: half of it fixed, half random"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def succeeded(self, message_id):
+        with self._lock:
+            entry = self._entries.pop(message_id, None)
+        if entry is not None:
+            self.store.delete_outbox(message_id)
+
+    def failed(self, message_id, error=None):
+        """Count a failed attempt; returns the retry time, or None once attempts run out"""
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is None:
+                return None
+            entry['attempts'] += 1
+            entry['last_error'] = error
+            if entry['attempts'] >= self.max_attempts:
+                del self._entries[message_id]
+                retry_at = None
+            else:
+                retry_at = datetime.now() + timedelta(seconds=self.backoff(entry['attempts']))
+                entry['next_attempt'] = retry_at.isoformat()
+                heapq.heappush(self._heap, (entry['next_attempt'], message_id))
+            saved = dict(entry)
+        if retry_at is None:
+            self.store.delete_outbox(message_id)
+        else:
+            self.store.save_outbox(saved)
+            self._wake.set()
+        return retry_at
+
+    def postpone(self, message_id, when):
+        """Move the next attempt without counting one (e.g. until business hours)"""
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is None:
+                return
+            entry['next_attempt'] = when.isoformat()
+            heapq.heappush(self._heap, (entry['next_attempt'], message_id))
+            saved = dict(entry)
+        self.store.save_outbox(saved)
+        self._wake.set()
+
+    def discard(self, message_id):
+        """Drop a message that no longer makes sense to send"""
+        self.succeeded(message_id)
+
+    def pending(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = datetime.now()
+            due = []
+            with self._lock:
+                while self._heap and self._heap[0][0] <= now.isoformat():
+                    next_attempt, message_id = heapq.heappop(self._heap)
+                    entry = self._entries.get(message_id)
+                    # Skip items superseded by a later failed() or postpone()
+                    if entry is not None and entry['next_attempt'] == next_attempt:
+                        due.append(dict(entry))
+                timeout = 60
+                if self._heap:
+                    next_at = datetime.fromisoformat(self._heap[0][0])
+                    timeout = min(timeout, max((next_at - now).total_seconds(), 0.1))
+            for entry in due:
+                try:
+                    self.resend(entry)
+                except Exception as e:
+                    print(f"Outbox retry error: {e}")
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+# DELIVERY LEDGER (outcome per appointment, reminder type and channel)
+class DeliveryLedger:
+    """Newest delivery status per (apt_id, reminder_type, channel), backed by an append-only store log"""
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._latest = {}  # (apt_id, reminder_type, channel) -> row
+
+    def load(self):
+        """Rebuild the lookup from the stored rows"""
+        with self._lock:
+            self._latest = {}
+            for row in self.store.load_ledger():
+                self._latest[(row['apt_id'], row['reminder_type'], row['channel'])] = row
+
+    def record(self, apt_id, reminder_type, channel, status, apt_date=''):
+        """Append an outcome ("sent" or "failed") and make it the current status"""
+        row = {
+            'apt_id': apt_id,
+            'reminder_type': reminder_type,
+            'channel': channel,
+            'status': status,
+            'at': datetime.now().isoformat(),
+            'apt_date': apt_date or ''
+        }
+        self.import_rows([row])
+        return row
+
+    def import_rows(self, rows):
+        """Append rows recorded elsewhere (legacy keys, imported backups)"""
+        rows = [dict(row) for row in rows]
+        if not rows:
+            return
+        # Store write under the same lock, so a concurrent prune cannot land between memory and disk
+        with self._lock:
+            for row in rows:
+                self._latest[(row['apt_id'], row['reminder_type'], row['channel'])] = row
+            self.store.append_ledger(rows)
+
+    def status(self, apt_id, reminder_type, channel):
+        """Current status, or None if nothing was recorded"""
+        row = self._latest.get((apt_id, reminder_type, channel))
+        return row['status'] if row else None
+
+    def count(self, channel=None, status='sent'):
+        with self._lock:
+            return sum(1 for (_, _, row_channel), row in self._latest.items()
+                       if row['status'] == status and channel in (None, row_channel))
+
+    def rows(self):
+        with self._lock:
+            return [dict(row) for row in self._latest.values()]
+
+    def prune(self, before_date, live_ids):
+        """Forget rows for appointments dated before before_date or no longer in the book"""
+        with self._lock:
+            expired = [key for key, row in self._latest.items()
+                       if key[0] not in live_ids or (row.get('apt_date') and row['apt_date'] < before_date)]
+            for key in expired:
+                del self._latest[key]
+            if expired:
+                self.store.prune_ledger(expired)
+        return len(expired)
+
+    def __len__(self):
+        return len(self._latest)
+
+
+# SMTP CONNECTION POOL (reuse authenticated sessions across a burst of reminder emails)
+class SMTPConnectionPool:
+    """Keeps up to max_sessions SMTP sessions logged in and reuses them between sends"""
+
+    # A pooled session the server already dropped fails on MAIL FROM; only then is it safe to
+    # reconnect and resend. Anything later (timeouts after DATA included) is not retried.
+    RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionResetError, BrokenPipeError)
+    # The server refused this message, but the session can carry the next one after RSET
+    REFUSED_ERRORS = (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)
+
+    def __init__(self, settings, max_sessions=2, idle_timeout=60):
+        self.settings = settings  # the app's email_settings dict, read on every connect
+        self.idle_timeout = idle_timeout
+        self._idle = []  # (smtp, last used monotonic time)
+        self._lock = threading.Lock()
+        self._sessions = threading.BoundedSemaphore(max_sessions)
+        self.stats = {"connects": 0, "reconnects": 0, "sent": 0}
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.settings.get("smtp_server", "smtp.gmail.com"),
+                            int(self.settings.get("smtp_port", 587)), timeout=30)
+        try:
+            smtp.ehlo()
+            if self.settings.get("use_tls", True):
+                smtp.starttls(context=ssl.create_default_context())
+                smtp.ehlo()
+            if self.settings.get("email_address") and self.settings.get("app_password"):
+                smtp.login(self.settings["email_address"], self.settings["app_password"])
+        except Exception:
+            self._quit(smtp)
+            raise
+        self._count("connects")
+        return smtp
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _quit(self, smtp):
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def _checkout(self):
+        """(session, reused): an idle session the server has not timed out yet, or a new one"""
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                smtp, last_used = self._idle.pop()
+                if now - last_used < self.idle_timeout:
+                    return smtp, True
+                self._quit(smtp)
+        return self._connect(), False
+
+    def _checkin(self, smtp):
+        with self._lock:
+            self._idle.append((smtp, time.monotonic()))
+
+    def build_message(self, to, subject, body):
+        sender = (self.settings.get("email_address") or "").strip()
+        if "@" not in sender:
+            raise ValueError("Sender email address is not set - enter 'Your Email' in Email Settings")
+        message = EmailMessage()
+        message["From"] = sender
+        message["To"] = to
+        message["Subject"] = subject
+        message.set_content(body)
+        return message
+
+    @staticmethod
+    def _envelope(smtp, message):
+        """MAIL FROM and RCPT TO; nothing has been delivered if this fails"""
+        code, response = smtp.mail(message["From"])
+        if code != 250:
+            raise smtplib.SMTPSenderRefused(code, response, message["From"])
+        code, response = smtp.rcpt(message["To"])
+        if code not in (250, 251):
+            raise smtplib.SMTPRecipientsRefused({message["To"]: (code, response)})
+
+    def send(self, to, subject, body):
+        """Send one email, reconnecting once if the pooled session went stale before DATA"""
+        message = self.build_message(to, subject, body)
+        with self._sessions:
+            smtp, reused = self._checkout()
+            try:
+                try:
+                    self._envelope(smtp, message)
+                except self.RECONNECT_ERRORS:
+                    if not reused:
+                        raise
+                    self._quit(smtp)
+                    self._count("reconnects")
+                    smtp = self._connect()
+                    self._envelope(smtp, message)
+                code, response = smtp.data(message.as_bytes(policy=message.policy.clone(linesep='\r\n')))
+                if code != 250:
+                    raise smtplib.SMTPDataError(code, response)
+            except self.REFUSED_ERRORS:
+                try:
+                    smtp.rset()
+                except Exception:
+                    self._quit(smtp)
+                else:
+                    self._checkin(smtp)
+                raise
+            except Exception:
+                self._quit(smtp)
+                raise
+            self._checkin(smtp)
+            self._count("sent")
+
+    def close_idle(self, max_idle=None):
+        """Log out of sessions unused for max_idle seconds (default idle_timeout)"""
+        max_idle = self.idle_timeout if max_idle is None else max_idle
+        now = time.monotonic()
+        with self._lock:
+            keep = []
+            for smtp, last_used in self._idle:
+                if now - last_used >= max_idle:
+                    self._quit(smtp)
+                else:
+                    keep.append((smtp, last_used))
+            self._idle = keep
+
+    def close(self):
+        """Log out of every idle session (also used after settings change)"""
+        self.close_idle(0)
+
+
+# ASYNC NOTIFICATION ENGINE (many emails / HTTP messages in flight at once)
+class AsyncNotificationEngine:
+    """asyncio loop on its own thread; sends run concurrently, bounded per channel"""
+
+    def __init__(self, limits=None):
+        self.limits = dict(limits or {"email": 10, "http": 20, "whatsapp": 1})
+        self.results = queue.Queue()  # (job, success, latency) for the Tk thread to drain
+        self.loop = asyncio.new_event_loop()
+        self._senders = {}
+        self._buckets = {}  # channel -> TokenBucket shared with the per-channel queues
+        self._semaphores = {}
+        self._http_session = None
+        self._thread = threading.Thread(target=self._run, name="notification-engine", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def register(self, channel, sender, bucket=None):
+        """sender is a coroutine function taking a DispatchJob and returning True/False"""
+        self._senders[channel] = sender
+        if bucket is not None:
+            self._buckets[channel] = bucket
+
+    def _semaphore(self, channel):
+        # Created lazily so it belongs to the engine's loop
+        if channel not in self._semaphores:
+            self._semaphores[channel] = asyncio.Semaphore(self.limits.get(channel, 5))
+        return self._semaphores[channel]
+
+    def submit(self, job):
+        """Thread-safe: schedule a job on the engine loop"""
+        job.enqueued_at = time.monotonic()
+        return asyncio.run_coroutine_threadsafe(self._run_job(job), self.loop)
+
+    async def _throttle(self, channel):
+        """Wait for the channel's rate limit without blocking the loop"""
+        bucket = self._buckets.get(channel)
+        while bucket is not None:
+            wait = bucket.take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    async def _run_job(self, job):
+        async with self._semaphore(job.channel):
+            try:
+                await self._throttle(job.channel)
+                success = bool(await self._senders[job.channel](job))
+            except Exception as e:
+                job.error = str(e)
+                success = False
+        self.results.put((job, success, time.monotonic() - job.enqueued_at))
+
+    async def run_blocking(self, func, *args):
+        """Run a blocking call (browser automation, smtplib) in the loop's executor"""
+        return await self.loop.run_in_executor(None, func, *args)
+
+    async def send_email(self, settings, message):
+        """Send an EmailMessage with aiosmtplib (callers already hold the email slot)"""
+        await aiosmtplib.send(
+            message,
+            hostname=settings.get("smtp_server", "smtp.gmail.com"),
+            port=int(settings.get("smtp_port", 587)),
+            start_tls=settings.get("use_tls", True),
+            username=settings.get("email_address") or None,
+            password=settings.get("app_password") or None
+        )
+
+    async def post_json(self, url, payload, headers=None, timeout=30):
+        """POST a JSON payload over a shared keep-alive session; returns (status, body)"""
+        async with self._semaphore("http"):
+            if AIOHTTP_AVAILABLE:
+                if self._http_session is None:
+                    self._http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout))
+                async with self._http_session.post(url, json=payload, headers=headers) as response:
+                    return response.status, await response.text()
+            return await self.run_blocking(http_post_json, url, payload, headers, timeout)
+
+    def stop(self):
+        async def shutdown():
+            if self._http_session is not None:
+                await self._http_session.close()
+            self.loop.stop()
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop)
+
+
+def http_post_json(url, payload, headers=None, timeout=30):
+    """Blocking JSON POST with urllib; returns (status, body)"""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode('utf-8'),
+        headers=dict({"Content-Type": "application/json"}, **(headers or {})),
+        method='POST'
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read().decode('utf-8', 'replace')
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode('utf-8', 'replace')
+
+
+# WHATSAPP TRANSPORTS (browser automation, or the WhatsApp Business API over HTTP)
+class WhatsAppAPIError(Exception):
+    """Non-2xx answer from the WhatsApp Business API"""
+
+    def __init__(self, status, body):
+        super().__init__(f"WhatsApp API returned HTTP {status}: {body[:200]}")
+        self.status = status
+        self.body = body
+
+
+class WhatsAppTransport:
+    """How a WhatsApp text leaves the clinic; send() returns True or raises"""
+
+    name = "base"
+    max_parallel = 1  # Messages a batch may have in flight at once
+
+    def send(self, phone, message):
+        raise NotImplementedError
+
+    def send_batch(self, messages):
+        """Send [(phone, message), ...]; returns [(success, error), ...] in the same order"""
+        results = []
+        for phone, message in messages:
+            try:
+                results.append((bool(self.send(phone, message)), None))
+            except Exception as e:
+                results.append((False, str(e)))
+        return results
+
+    def close(self):
+        pass
+
+
+class BrowserWhatsAppTransport(WhatsAppTransport):
+    """wa.me link in the browser plus a simulated Enter key (needs a logged-in desktop)"""
+
+    name = "browser"
+
+    def __init__(self, send_func):
+        self._send = send_func
+
+    def send(self, phone, message):
+        return self._send(phone, message)
+
+
+class WhatsAppAPITransport(WhatsAppTransport):
+    """WhatsApp Business (Cloud) API over a pool of keep-alive HTTP connections"""
+
+    name = "api"
+    # A pooled connection the server already closed fails on first use; retry once on a fresh one.
+    # Timeouts and other errors are not retried: the request may have been delivered already.
+    RECONNECT_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+    def __init__(self, api_url, token, max_connections=4, timeout=30):
+        parts = urllib.parse.urlsplit(api_url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Invalid WhatsApp API URL: {api_url!r}")
+        self.api_url = api_url
+        self._https = parts.scheme == "https"
+        self._host = parts.hostname
+        self._port = parts.port
+        self._path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.headers = {"Content-Type": "application/json"}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+        self.max_parallel = max(int(max_connections), 1)
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_parallel)
+        self._stats_lock = threading.Lock()
+        self.stats = {"connects": 0, "reconnects": 0, "sent": 0, "failed": 0}
+
+    @staticmethod
+    def build_payload(phone, message):
+        return {
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "to": phone,
+            "type": "text",
+            "text": {"preview_url": False, "body": message}
+        }
+
+    def _count(self, key):
+        # send_batch calls send() from several threads
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _connect(self):
+        self._count("connects")
+        if self._https:
+            return http.client.HTTPSConnection(self._host, self._port, timeout=self.timeout,
+                                               context=ssl.create_default_context())
+        return http.client.HTTPConnection(self._host, self._port, timeout=self.timeout)
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _checkin(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def _post(self, conn, body):
+        conn.request("POST", self._path, body=body, headers=self.headers)
+        response = conn.getresponse()
+        # The body has to be read in full before the connection can carry the next request
+        text = response.read().decode('utf-8', 'replace')
+        return response.status, text, response.will_close
+
+    def send(self, phone, message):
+        body = json.dumps(self.build_payload(phone, message)).encode('utf-8')
+        with self._slots:
+            conn, reused = self._checkout()
+            try:
+                status, text, will_close = self._post(conn, body)
+            except Exception as e:
+                conn.close()
+                if not (reused and isinstance(e, self.RECONNECT_ERRORS)):
+                    self._count("failed")
+                    raise
+                self._count("reconnects")
+                conn = self._connect()
+                try:
+                    status, text, will_close = self._post(conn, body)
+                except Exception:
+                    conn.close()
+                    self._count("failed")
+                    raise
+            if will_close:
+                conn.close()
+            else:
+                self._checkin(conn)
+        if not 200 <= status < 300:
+            self._count("failed")
+            raise WhatsAppAPIError(status, text)
+        self._count("sent")
+        return True
+
+    def send_batch(self, messages):
+        """Send a batch concurrently, one message per pooled connection at a time"""
+        if len(messages) <= 1:
+            return super().send_batch(messages)
+        serial = super().send_batch
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_parallel, len(messages)),
+                                                   thread_name_prefix="whatsapp-api") as pool:
+            return list(pool.map(lambda item: serial([item])[0], messages))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class MockWhatsAppServer:
+    """Local stand-in for the Business API so transport throughput can be measured offline"""
+
+    def __init__(self, port=0, latency=0.0):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+            disable_nagle_algorithm = True  # Headers and body go out in separate writes
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.stats["connections"] += 1
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                    to = payload["to"]
+                    payload["text"]["body"]
+                except (ValueError, KeyError, TypeError):
+                    self._reply(400, {"error": {"message": "Invalid parameter", "code": 100}})
+                    return
+                if server.latency:
+                    time.sleep(server.latency)
+                with server._lock:
+                    server.stats["messages"] += 1
+                    message_id = f"wamid.mock{server.stats['messages']}"
+                self._reply(200, {
+                    "messaging_product": "whatsapp",
+                    "contacts": [{"input": to, "wa_id": to}],
+                    "messages": [{"id": message_id}]
+                })
+
+            def _reply(self, status, data):
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.latency = latency
+        self.stats = {"connections": 0, "messages": 0}
+        self._lock = threading.Lock()
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}/v17.0/MOCK_PHONE_ID/messages"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-whatsapp", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def benchmark_whatsapp_transport(count=500, connections=4, latency=0.02):
+    """Push `count` messages through WhatsAppAPITransport against the mock server"""
+    with MockWhatsAppServer(latency=latency) as server:
+        transport = WhatsAppAPITransport(server.url, "mock-token", max_connections=connections)
+        messages = [(f"1555{n:07d}", f"Benchmark reminder {n}") for n in range(count)]
+        started = time.perf_counter()
+        results = transport.send_batch(messages)
+        elapsed = time.perf_counter() - started
+        transport.close()
+        connections_opened = server.stats["connections"]
+    sent = sum(1 for success, _ in results if success)
+    print(f"WhatsApp API transport: {sent}/{count} sent in {elapsed:.2f}s "
+          f"({sent / elapsed:.0f} msg/s) over {connections_opened} connection(s), "
+          f"{latency * 1000:.0f} ms simulated server latency")
+    return {"sent": sent, "elapsed": elapsed, "connections": connections_opened}
+
+
+class MockSMTPServer:
+    """Local SMTP stand-in (no TLS, no login) so session reuse can be measured offline"""
+
+    def __init__(self, port=0, latency=0.0):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with server._lock:
+                    server.stats["connections"] += 1
+                self._reply("220 mock.local ESMTP ready")
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line[:4].decode('ascii', 'replace').upper()
+                    if command == "EHLO":
+                        self._reply("250-mock.local", "250 8BITMIME")
+                    elif command in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                        self._reply("250 OK")
+                    elif command == "DATA":
+                        self._reply("354 End data with <CR><LF>.<CR><LF>")
+                        while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                            pass
+                        with server._lock:
+                            server.stats["messages"] += 1
+                        self._reply("250 OK queued")
+                    elif command == "QUIT":
+                        self._reply("221 Bye")
+                        return
+                    else:
+                        self._reply("502 Command not implemented")
+
+            def _reply(self, *lines):
+                # Every server round trip costs `latency`, like a remote relay
+                if server.latency:
+                    time.sleep(server.latency)
+                self.wfile.write("".join(f"{line}\r\n" for line in lines).encode('ascii'))
+
+        self.latency = latency
+        self.stats = {"connections": 0, "messages": 0}
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-smtp", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def benchmark_email(count=200, sessions=2, latency=0.005):
+    """Send `count` emails through SMTPConnectionPool against the mock server, then one session per email"""
+    with MockSMTPServer(latency=latency) as server:
+        settings = {"smtp_server": "127.0.0.1", "smtp_port": server.port, "use_tls": False,
+                    "email_address": "clinic@example.com"}
+        pool = SMTPConnectionPool(settings, max_sessions=sessions)
+        messages = [(f"patient{n}@example.com", f"Benchmark reminder {n}", "See you tomorrow.")
+                    for n in range(count)]
+        
+        def send_fresh(item):
+            with smtplib.SMTP("127.0.0.1", server.port, timeout=30) as smtp:
+                smtp.ehlo()
+                smtp.send_message(pool.build_message(*item))
+        
+        timings = {}
+        for label, send in (("pooled", lambda item: pool.send(*item)), ("fresh", send_fresh)):
+            opened = server.stats["connections"]
+            started = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=sessions,
+                                                       thread_name_prefix="email-bench") as workers:
+                list(workers.map(send, messages))
+            timings[label] = (time.perf_counter() - started, server.stats["connections"] - opened)
+            pool.close()
+        delivered = server.stats["messages"]
+    (pooled, pooled_connections), (fresh, fresh_connections) = timings["pooled"], timings["fresh"]
+    print(f"SMTP pool: {count} emails in {pooled:.2f}s ({count / pooled:.0f} msg/s) over "
+          f"{pooled_connections} connection(s); one session per email: {fresh:.2f}s over "
+          f"{fresh_connections} connection(s), {latency * 1000:.0f} ms simulated round trip")
+    return {"delivered": delivered, "pooled": pooled, "pooled_connections": pooled_connections,
+            "fresh": fresh, "fresh_connections": fresh_connections}
+
+
+# UI EVENT BUS (worker threads publish; the Tk thread drains on a fixed cadence)
+UI_EVENT_INTERVAL_MS = 250
+
+
+class UIEventBus:
+    """Thread-safe queue of UI events so only the Tk thread ever touches widgets"""
+
+    def __init__(self, max_batch=1000):
+        self._queue = queue.SimpleQueue()
+        self._handlers = {}  # kind -> handler(list of payloads)
+        self.max_batch = max_batch
+
+    def subscribe(self, kind, handler):
+        """handler receives every payload of this kind collected in one drain"""
+        self._handlers[kind] = handler
+
+    def publish(self, kind, payload):
+        """Safe from any thread"""
+        self._queue.put((kind, payload))
+
+    def drain(self):
+        """Tk thread: group waiting events by kind and call each handler once"""
+        batches = {}
+        for _ in range(self.max_batch):
+            try:
+                kind, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batches.setdefault(kind, []).append(payload)
+        for kind, payloads in batches.items():
+            handler = self._handlers.get(kind)
+            if handler:
+                try:
+                    handler(payloads)
+                except Exception as e:
+                    print(f"UI event handler error ({kind}): {e}")
+        return sum(len(payloads) for payloads in batches.values())
+
+
+# TREEVIEW RENDERING (diff rows by record version, window very long lists)
+VIRTUAL_TREE_THRESHOLD = 2000  # Above this many rows only a window is materialized ...
+VIRTUAL_TREE_WINDOW = 300  # ... of this many rows around the scroll position
+
+
+def appointment_tree_values(apt):
+    """Row values for the appointments tree"""
+    # Truncate long text for display
+    name = apt['patient_name'][:15] + "..." if len(apt['patient_name']) > 15 else apt['patient_name']
+    procedure = apt['procedure'][:12] + "..." if len(apt['procedure']) > 12 else apt['procedure']
+    notes = apt.get('notes', '')[:12] + "..." if len(apt.get('notes', '')) > 12 else apt.get('notes', '')
+    
+    # Create datetime display
+    date_str = apt.get('appointment_date', 'N/A')
+    time_str = apt.get('appointment_time', '09:00')
+    
+    # WhatsApp status
+    whatsapp_status = "📱ON" if apt.get('enable_reminders', True) else "📱OFF"
+    
+    return (apt['id'], name, procedure, apt['phone_number'], apt.get('email', ''),
+            f"{date_str} {time_str}", whatsapp_status, notes)
+
+
+def search_tree_values(apt):
+    """Row values for the search results tree (no Email column)"""
+    values = appointment_tree_values(apt)
+    return values[:4] + values[5:]
+
+
+class VirtualTreeView:
+    """Keeps a Treeview in step with an ordered list of records, touching only rows that changed"""
+
+    # Rows are keyed by record id (iid = str(id)) and remember the record version they
+    # show, so a refresh re-renders only edited rows. Past `threshold` rows only a window
+    # around the scroll position exists in the tree; the scrollbar is driven from here
+    # so it still spans the whole list.
+
+    def __init__(self, tree, scrollbar, row_values, threshold=VIRTUAL_TREE_THRESHOLD,
+                 window=VIRTUAL_TREE_WINDOW):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.row_values = row_values  # record -> tuple of column values
+        self.threshold = threshold
+        self.window = window
+        self.ids = []  # Display order
+        self.records = {}  # id -> record being shown
+        self.rendered = {}  # id -> version of the row currently in the tree
+        self.start = 0  # Position of the first materialized row
+        tree.configure(yscrollcommand=self._on_tree_scroll)
+        scrollbar.configure(command=self._on_scrollbar)
+
+    @property
+    def virtual(self):
+        return len(self.ids) > self.threshold
+
+    def __len__(self):
+        return len(self.ids)
+
+    def set_rows(self, records):
+        """Show these records, in this order"""
+        self.records = {record['id']: record for record in records}
+        self.ids = list(self.records)
+        if self.virtual:
+            self.start = min(self.start, max(len(self.ids) - self.window, 0))
+            self._render(self.ids[self.start:self.start + self.window])
+        else:
+            self.start = 0
+            self._render(self.ids)
+
+    def _render(self, ids):
+        """Diff the tree against ids: drop, insert or re-value rows, then fix the order"""
+        tree, rendered, records = self.tree, self.rendered, self.records
+        wanted = set(ids)
+        stale = [apt_id for apt_id in rendered if apt_id not in wanted]
+        if stale:
+            tree.delete(*[str(apt_id) for apt_id in stale])
+            for apt_id in stale:
+                del rendered[apt_id]
+        for position, apt_id in enumerate(ids):
+            record = records[apt_id]
+            if apt_id not in rendered:
+                tree.insert('', position, iid=str(apt_id), values=self.row_values(record))
+            elif rendered[apt_id] != record.version:
+                tree.item(str(apt_id), values=self.row_values(record))
+            else:
+                continue
+            rendered[apt_id] = record.version
+        wanted_order = tuple(str(apt_id) for apt_id in ids)
+        if tree.get_children() != wanted_order:
+            for position, iid in enumerate(wanted_order):
+                tree.move(iid, '', position)
+
+    def _show_row(self, row):
+        """Materialize the window around `row` and scroll the tree to it"""
+        total = len(self.ids)
+        row = min(max(row, 0), max(total - 1, 0))
+        self.start = min(max(row - self.window // 2, 0), max(total - self.window, 0))
+        self._render(self.ids[self.start:self.start + self.window])
+        self.tree.yview_moveto((row - self.start) / max(len(self.rendered), 1))
+
+    def scroll_to_top(self):
+        if self.virtual and self.start:
+            self._show_row(0)
+        self.tree.yview_moveto(0)
+
+    def _on_tree_scroll(self, first, last):
+        if not self.virtual:
+            self.scrollbar.set(first, last)
+            return
+        # Translate the tree's position within the window to the whole list
+        shown, total = max(len(self.rendered), 1), len(self.ids)
+        top = self.start + float(first) * shown
+        bottom = self.start + float(last) * shown
+        self.scrollbar.set(top / total, bottom / total)
+        # Close to either end of the window with more rows beyond it: re-center
+        margin = self.window // 4
+        if ((top - self.start < margin and self.start > 0) or
+                (self.start + shown - bottom < margin and self.start + shown < total)):
+            self._show_row(int(top))
+
+    def _on_scrollbar(self, *args):
+        if self.virtual and args and args[0] == 'moveto':
+            self._show_row(int(float(args[1]) * len(self.ids)))
+        else:
+            # Unit and page steps scroll inside the window; its edges re-center it
+            self.tree.yview(*args)
+
+
+# CHANGE TRACKING + BACKGROUND WRITER (persist only what changed, off the Tk thread)
+class ChangeTracker:
+    """Records which appointments changed since the last save"""
+
+    def __init__(self, on_change=None):
+        self._lock = threading.Lock()
+        self._appointments = {}  # id -> appointment copy, or None when deleted
+        self._meta = {}  # store bookkeeping such as the id sequence
+        self._full = None  # every appointment, after import/quick save
+        self.on_change = on_change
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def mark_appointment(self, appointment):
+        """Mark one appointment as added or edited"""
+        # Copy on the caller's thread so the writer never sees a half-edited dict
+        with self._lock:
+            self._appointments[appointment['id']] = dict(appointment)
+        self._changed()
+
+    def mark_deleted(self, apt_id):
+        """Mark one appointment as deleted"""
+        with self._lock:
+            self._appointments[apt_id] = None
+        self._changed()
+
+    def mark_meta(self, key, value):
+        """Mark a store bookkeeping value as changed"""
+        with self._lock:
+            self._meta[key] = value
+        self._changed()
+
+    def mark_all(self, appointments):
+        """Mark the whole data set for rewrite (import, manual save)"""
+        with self._lock:
+            self._full = [dict(apt) for apt in appointments]
+            self._appointments.clear()
+        self._changed()
+
+    def has_changes(self):
+        """True if anything is waiting to be saved"""
+        with self._lock:
+            return bool(self._appointments or self._meta or self._full)
+
+    def drain(self):
+        """Take all pending changes, leaving the tracker clean"""
+        with self._lock:
+            pending = (self._appointments, self._full, self._meta)
+            self._appointments, self._full, self._meta = {}, None, {}
+        return pending
+
+    def restore(self, appointments, full, meta):
+        """Put back changes that failed to save, without overwriting newer ones"""
+        with self._lock:
+            if full and not self._full:
+                self._full = full
+            for key, value in meta.items():
+                self._meta.setdefault(key, value)
+            for apt_id, apt in appointments.items():
+                self._appointments.setdefault(apt_id, apt)
+
+
+class BackgroundWriter:
+    """Worker thread that coalesces tracked changes and writes them to the store"""
+
+    def __init__(self, store, tracker, coalesce_delay=0.5):
+        self.store = store
+        self.tracker = tracker
+        self.coalesce_delay = coalesce_delay
+        self.stats = {
+            "saves": 0,
+            "last_duration_ms": 0.0,
+            "max_duration_ms": 0.0,
+            "last_bytes": 0,
+            "total_bytes": 0,
+            "last_saved_at": None,
+            "last_error": None
+        }
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._save_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="background-writer", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        """Wake the writer; bursts inside coalesce_delay end up in one save"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            # Let a burst of edits settle before writing
+            self._stopping.wait(self.coalesce_delay)
+            self.save_pending()
+        self.save_pending()
+
+    def save_pending(self):
+        """Write everything the tracker holds; returns bytes written"""
+        with self._save_lock:
+            appointments, full, meta = self.tracker.drain()
+            if not (appointments or full or meta):
+                return 0
+            # Heartbeat for the catch-up pass at next start; written only with real changes
+            # (and at shutdown), so an idle app never touches the disk
+            meta = dict(meta, last_heartbeat=datetime.now().isoformat(timespec='seconds'))
+            started = time.perf_counter()
+            try:
+                written = self.store.apply_changes(appointments, full, meta)
+            except Exception as e:
+                self.tracker.restore(appointments, full, meta)
+                self.stats["last_error"] = str(e)
+                print(f"Background save error: {e}")
+                return 0
+            duration_ms = (time.perf_counter() - started) * 1000
+            self.stats["saves"] += 1
+            self.stats["last_duration_ms"] = duration_ms
+            self.stats["max_duration_ms"] = max(self.stats["max_duration_ms"], duration_ms)
+            self.stats["last_bytes"] = written
+            self.stats["total_bytes"] += written
+            self.stats["last_saved_at"] = datetime.now().strftime('%H:%M:%S')
+            self.stats["last_error"] = None
+            return written
+
+    def flush(self, deadline=5.0):
+        """Stop the writer after a final save; False if it missed the deadline"""
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(deadline)
+        return not self._thread.is_alive()
+
+
+# STRESS CHECK (UI-side writers against reminder-side readers)
+def stress_test_appointment_book(seconds=5.0, readers=4, size=2000, state_dir=None):
+    """Hammer the book, scheduler, ledger, store and state files from several threads; returns the problems found"""
+    if state_dir is None:
+        import tempfile
+        state_dir = tempfile.mkdtemp(prefix="clinic-stress-")
+    book = AppointmentBook()
+    scheduler = ReminderScheduler()
+    book.add_listener(scheduler)
+    book.load([Appointment.from_dict({
+        'id': i + 1,
+        'patient_name': f"Patient {i}",
+        'procedure': f"Procedure {i % 7}: check",
+        'phone_number': f"555{i:07d}",
+        'appointment_date': (date.today() + timedelta(days=i % 30)).strftime('%Y-%m-%d'),
+        'appointment_time': f"{9 + i % 8:02d}:00",
+        'enable_reminders': True
+    }) for i in range(size)])
+    store = SQLiteAppointmentStore(os.path.join(state_dir, "stress.db"))
+    store.apply_changes({}, full=[apt.to_dict() for apt in book])
+    ledger = DeliveryLedger(store)
+    tracker = ChangeTracker()
+    store_writer = BackgroundWriter(store, tracker, coalesce_delay=0.01)
+    tracker.on_change = store_writer.notify
+    stop = threading.Event()
+    problems = []
+    counts = {"reads": 0, "writes": 0, "saves": 0, "reminders": 0, "prunes": 0}
+
+    def writer():
+        # Plays the Tk thread: add, edit, delete and the occasional full reload, each tracked for saving
+        rng = random.Random(1)
+        while not stop.is_set():
+            op = rng.random()
+            ids = list(book.snapshot())
+            if op < 0.4 and ids:
+                apt_id = rng.choice(ids)
+                tracker.mark_appointment(book.update(apt_id, {
+                    'patient_name': f"Edited {rng.random()}",
+                    'appointment_date': (date.today() + timedelta(days=rng.randrange(30))).strftime('%Y-%m-%d')
+                }))
+            elif op < 0.7:
+                apt_id = book.allocate_id()
+                appointment = Appointment.from_dict({
+                    'id': apt_id, 'patient_name': f"New {apt_id}", 'procedure': "X", 'phone_number': "5551234567",
+                    'appointment_date': date.today().strftime('%Y-%m-%d'), 'appointment_time': "23:00"
+                })
+                book.add(appointment)
+                tracker.mark_appointment(appointment)
+            elif op < 0.995 and ids:
+                apt_id = rng.choice(ids)
+                book.remove(apt_id)
+                tracker.mark_deleted(apt_id)
+            else:
+                book.load([apt.copy() for apt in book], book.next_id)
+                tracker.mark_all(book)
+            counts["writes"] += 1
+
+    def wait_for_writes(n):
+        target = counts["writes"] + n
+        while counts["writes"] < target and not stop.is_set():
+            time.sleep(0.001)
+
+    def reader():
+        # Plays the UI readers: consistent snapshots, records that never change once handed out
+        while not stop.is_set():
+            snapshot = book.snapshot()
+            records = list(snapshot.items())
+            seen = [(apt_id, appointment, appointment['patient_name'], appointment['appointment_date'])
+                    for apt_id, appointment in records[:200]]
+            wait_for_writes(5)
+            for apt_id, appointment, name, apt_date in seen:
+                if appointment['id'] != apt_id:
+                    problems.append(f"record {appointment['id']} filed under {apt_id}")
+                if (appointment['patient_name'], appointment['appointment_date']) != (name, apt_date):
+                    problems.append(f"record {apt_id} changed under a reader")
+            if len(snapshot) != len(records):
+                problems.append("snapshot changed size while being read")
+            today = date.today().strftime('%Y-%m-%d')
+            for appointment in book.on_date(today):
+                if appointment['appointment_date'] != today:
+                    problems.append(f"date index returned {appointment['id']} for the wrong day")
+            counts["reads"] += 1
+
+    def reminders():
+        # Plays the reminder thread: pop everything due in the next month, defer some, record the rest
+        rng = random.Random(2)
+        while not stop.is_set():
+            now = datetime.now() + timedelta(days=31)
+            for event in scheduler.pop_due(now):
+                due, _, _, apt_id, reminder_type = event
+                if due > now:
+                    problems.append(f"scheduler popped {apt_id}/{reminder_type} before it was due")
+                if rng.random() < 0.2:
+                    scheduler.defer(event, due + timedelta(days=40))
+                    continue
+                appointment = book.get(apt_id)
+                if appointment is not None:
+                    ledger.record(apt_id, reminder_type, "whatsapp", "sent", appointment['appointment_date'])
+                    counts["reminders"] += 1
+            wait_for_writes(20)
+
+    def housekeeper():
+        # Plays the daily prune racing the reminder thread's ledger writes
+        while not stop.is_set():
+            ledger.prune((date.today() + timedelta(days=15)).strftime('%Y-%m-%d'), set(book.snapshot()))
+            counts["prunes"] += 1
+            stop.wait(0.01)
+
+    def saver(path, tag):
+        # Two threads saving the same settings file
+        n = 0
+        while not stop.is_set():
+            atomic_write_json(path, {"writer": tag, "n": n})
+            n += 1
+            counts["saves"] += 1
+
+    state_path = os.path.join(state_dir, "settings.json")
+    threads = [threading.Thread(target=writer), threading.Thread(target=reminders),
+               threading.Thread(target=housekeeper)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=saver, args=(state_path, tag)) for tag in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    stop.wait(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    # Whatever survived must be one writer's complete document, generations included
+    for candidate in [state_path] + [f"{state_path}.{i}" for i in range(1, STATE_GENERATIONS + 1)]:
+        try:
+            with open(candidate, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("writer") not in ("a", "b"):
+                problems.append(f"{candidate} holds an unexpected document")
+        except (OSError, ValueError) as e:
+            problems.append(f"{candidate} unreadable: {e}")
+    if set(book.snapshot()) != set(book.indexes._keys):
+        problems.append("indexes out of step with the book")
+
+    # Removed appointments must leave no live reminders behind
+    live = set(book.snapshot())
+    orphans = {apt_id for _, _, generation, apt_id, _ in scheduler._heap
+               if generation == scheduler._generation.get(apt_id) and apt_id not in live}
+    if orphans:
+        problems.append(f"scheduler still plans reminders for {len(orphans)} removed appointment(s)")
+
+    # The stored ledger and appointments must match memory once the writers are done
+    stored_ledger = DeliveryLedger(store)
+    stored_ledger.load()
+    if sorted(map(sorted, (row.items() for row in stored_ledger.rows()))) != \
+            sorted(map(sorted, (row.items() for row in ledger.rows()))):
+        problems.append("stored delivery ledger differs from the in-memory one")
+    if not store_writer.flush(deadline=10.0):
+        problems.append("background writer missed its flush deadline")
+    stored = {apt['id']: apt['patient_name'] for apt in store.load_appointments()}
+    if stored != {apt_id: apt['patient_name'] for apt_id, apt in book.snapshot().items()}:
+        problems.append("stored appointments differ from the book")
+    store.close()
+
+    print(f"Stress test: {counts['writes']} writes, {counts['reads']} read passes, "
+          f"{counts['reminders']} reminders, {counts['prunes']} ledger prunes, "
+          f"{counts['saves']} file saves in {seconds:.0f}s - "
+          f"{len(problems)} problem(s)" + (f", first: {problems[0]}" if problems else ""))
+    return problems
+
+
 class ModernCompactClinicSystem:
     def __init__(self):
-        self.load_email_settings()
-        self.appointments = []
+        self.appointments = AppointmentBook()
+        self.reminder_scheduler = ReminderScheduler()
+        self.appointments.add_listener(self.reminder_scheduler)
+        self.search_index = SearchIndex()
+        self.appointments.add_listener(self.search_index)
+        self.appointment_sorter = AppointmentSorter()
+        self.appointments.add_listener(self.appointment_sorter)
+        self.view_sort = None  # (column, descending) of the View page, if sorted
+        self.search_after_id = None  # Pending debounced search
+        self.view_filter = None  # AppointmentFilter applied to the View page, if any
         self.current_theme = "light"
         self.reminder_settings = {
             "enabled": True,
@@ -43,12 +3730,22 @@ class ModernCompactClinicSystem:
             "business_hours_end": "18:00",
             "check_interval": 300,  # Check every 5 minutes for testing
             "auto_send_whatsapp": True,
-            "whatsapp_delay": 3
+            "whatsapp_delay": 3,
+            "whatsapp_transport": "browser",  # "browser" or "api" (WhatsApp Business API)
+            "whatsapp_api_url": "",  # e.g. https://graph.facebook.com/v17.0/<phone-number-id>/messages
+            "whatsapp_api_token": "",
+            "whatsapp_api_connections": 4,
+            "retry_max_attempts": 6,  # Failed sends are retried from the outbox with backoff
+            "retry_base_delay": 60,  # Seconds before the first retry; doubles each attempt
+            "retry_max_delay": 3600,
+            "ledger_ttl_days": 30,  # Delivery records are kept this long after the appointment date
+            "async_engine": False  # Send through AsyncNotificationEngine instead of the dispatch queues
         }
         self.email_settings = {  # <--- MOVE THIS UP HERE!
             "enabled": True,
             "smtp_server": "smtp.gmail.com",
             "smtp_port": 587,
+            "use_tls": True,
             "email_address": "",
             "app_password": "",
             "clinic_name": "Modern Clinic System",
@@ -57,14 +3754,52 @@ class ModernCompactClinicSystem:
             "auto_send_email": True,
             "email_delay": 2
         }
-        self.sent_reminders = {}
+        self.load_email_settings()
+        self.smtp_pool = SMTPConnectionPool(self.email_settings)
         self.reminder_thread = None
         self.reminder_running = False
+        self.ui_events = UIEventBus()
+        self.reminder_logger = ReminderLogger()
+        self.ui_events.subscribe("log", self.add_log_entries)
+        self.ui_events.subscribe("toast", self.show_toast_batch)
+        self.ui_events.subscribe("log_page", self.show_log_page)
+        self.ui_events.subscribe("search_results", self.show_search_results)
+        self.search_executor = SearchExecutor(
+            lambda *results: self.ui_events.publish("search_results", results))
+        self.search_serial = 0  # Query whose results the search tree should show
+        self.search_shown_serial = 0  # Query whose rows are in the tree now
+        self.log_page = 0
+        self.log_query_serial = 0  # Results of superseded queries are dropped
+        self.store = open_appointment_store()
+        self.migrate_reminder_log()
+        self.delivery_ledger = DeliveryLedger(self.store)
+        self._ledger_pruned_on = None
+        self._inflight_reminders = {}  # reminder key -> channels still sending
+        self._inflight_lock = threading.Lock()
+        self.change_tracker = ChangeTracker()
+        self.writer = BackgroundWriter(self.store, self.change_tracker)
+        self.change_tracker.on_change = self.writer.notify
         self.setup_themes()
         self.setup_gui()
         self.load_data()
         self.load_reminder_data()
         self.setup_keyboard_shortcuts()
+        self.whatsapp_transport = self.create_whatsapp_transport()
+        self.setup_dispatchers()
+        self.notification_engine = None
+        if self.reminder_settings.get("async_engine"):
+            self.start_notification_engine()
+        self.outbox = ReminderOutbox(
+            self.store,
+            self.retry_outbox_entry,
+            max_attempts=self.reminder_settings.get("retry_max_attempts", 6),
+            base_delay=self.reminder_settings.get("retry_base_delay", 60),
+            max_delay=self.reminder_settings.get("retry_max_delay", 3600)
+        )
+        self.resume_outbox()
+        self.run_reminder_catchup()
+        self.update_dispatch_status()
+        self.pump_ui_events()
         self.auto_save_active = True
         self.start_auto_save()
         self.start_reminder_system()
@@ -246,21 +3981,18 @@ class ModernCompactClinicSystem:
 
     def save_email_settings(self):
         """Save email settings to file"""
+        if hasattr(self, 'dispatchers'):
+            self.dispatchers["email"].bucket.set_interval(self.email_settings.get("email_delay", 2))
+        # Drop sessions logged in with the old address/password
+        self.smtp_pool.close()
         try:
-            with open('email_settings.json', 'w') as f:
-                json.dump(self.email_settings, f, indent=2)
-        except:
-            pass
+            atomic_write_json('email_settings.json', self.email_settings)
+        except Exception as e:
+            print(f"Could not save email settings: {e}")
 
     def load_email_settings(self):
         """Load email settings from file"""
-        try:
-            if os.path.exists('email_settings.json'):
-                with open('email_settings.json', 'r') as f:
-                    saved_settings = json.load(f)
-                    self.email_settings.update(saved_settings)
-        except:
-            pass
+        self.email_settings.update(load_json_state('email_settings.json', {}))
     
     def validate_email(self, email):
         """Validate email format"""
@@ -272,15 +4004,6 @@ class ModernCompactClinicSystem:
 
     def send_email_reminder(self, appointment, reminder_type):
         """Send email reminder to patient"""
-        if not EMAIL_AVAILABLE:
-            self.log_reminder_activity(
-                appointment['patient_name'], 
-                appointment.get('email', 'N/A'),
-                f"Email library not available for {reminder_type} reminder", 
-                "ERROR"
-            )
-            return False
-    
         email = appointment.get('email', '').strip()
         if not email or not self.validate_email(email):
             return False
@@ -290,18 +4013,9 @@ class ModernCompactClinicSystem:
             subject = self.get_email_subject(appointment, reminder_type)
             body = self.get_email_body(appointment, reminder_type)
             
-            # Send email using yagmail
+            # Send over a pooled SMTP session (no new login per email)
             if self.email_settings.get("auto_send_email", True):
-                yag = yagmail.SMTP(
-                    self.email_settings["email_address"], 
-                    self.email_settings["app_password"]
-                )
-                yag.send(
-                    to=email,
-                    subject=subject,
-                        contents=body
-                )
-                yag.close()
+                self.smtp_pool.send(email, subject, body)
                 
                 self.log_reminder_activity(
                     appointment['patient_name'], 
@@ -799,6 +4513,18 @@ class ModernCompactClinicSystem:
         )
         auto_cb.pack(anchor='w', pady=2)
         
+        # Async engine checkbox
+        self.async_engine_var = tk.BooleanVar(value=self.reminder_settings.get("async_engine", False))
+        tk.Checkbutton(
+            whatsapp_frame,
+            text="⚡ Send concurrently with the async notification engine",
+            variable=self.async_engine_var,
+            bg=theme["bg_secondary"],
+            fg=theme["text_primary"],
+            font=self.fonts["body"],
+            command=self.toggle_async_engine
+        ).pack(anchor='w', pady=2)
+        
         # Delay setting
         delay_frame = tk.Frame(whatsapp_frame, bg=theme["bg_secondary"])
         delay_frame.pack(anchor='w', pady=5)
@@ -830,6 +4556,70 @@ class ModernCompactClinicSystem:
             font=self.fonts["body"]
         ).pack(side='left')
         
+        # Transport: browser automation or the WhatsApp Business API
+        transport_frame = tk.Frame(whatsapp_frame, bg=theme["bg_secondary"])
+        transport_frame.pack(anchor='w', pady=5)
+        
+        tk.Label(
+            transport_frame,
+            text="🚚 Send via:",
+            bg=theme["bg_secondary"],
+            fg=theme["text_primary"],
+            font=self.fonts["body"]
+        ).pack(side='left')
+        
+        self.whatsapp_transport_var = tk.StringVar(value=self.reminder_settings.get("whatsapp_transport", "browser"))
+        for value, text in (("browser", "Browser"), ("api", "Business API")):
+            tk.Radiobutton(
+                transport_frame,
+                text=text,
+                value=value,
+                variable=self.whatsapp_transport_var,
+                bg=theme["bg_secondary"],
+                fg=theme["text_primary"],
+                font=self.fonts["body"]
+            ).pack(side='left', padx=(10, 0))
+        
+        api_frame = tk.Frame(whatsapp_frame, bg=theme["bg_secondary"])
+        api_frame.pack(anchor='w', pady=5)
+        
+        tk.Label(
+            api_frame,
+            text="🔗 API URL:",
+            bg=theme["bg_secondary"],
+            fg=theme["text_primary"],
+            font=self.fonts["body"]
+        ).grid(row=0, column=0, sticky='w')
+        
+        self.whatsapp_api_url_var = tk.StringVar(value=self.reminder_settings.get("whatsapp_api_url", ""))
+        tk.Entry(
+            api_frame,
+            textvariable=self.whatsapp_api_url_var,
+            width=45,
+            font=self.fonts["body"],
+            bg=theme["bg_primary"],
+            fg=theme["text_primary"]
+        ).grid(row=0, column=1, sticky='w', padx=(10, 0), pady=2)
+        
+        tk.Label(
+            api_frame,
+            text="🔑 Access token:",
+            bg=theme["bg_secondary"],
+            fg=theme["text_primary"],
+            font=self.fonts["body"]
+        ).grid(row=1, column=0, sticky='w')
+        
+        self.whatsapp_api_token_var = tk.StringVar(value=self.reminder_settings.get("whatsapp_api_token", ""))
+        tk.Entry(
+            api_frame,
+            textvariable=self.whatsapp_api_token_var,
+            width=45,
+            show='*',
+            font=self.fonts["body"],
+            bg=theme["bg_primary"],
+            fg=theme["text_primary"]
+        ).grid(row=1, column=1, sticky='w', padx=(10, 0), pady=2)
+        
         # Business hours
         hours_frame = tk.Frame(settings_inner, bg=theme["bg_secondary"])
         hours_frame.grid(row=3, column=0, columnspan=2, sticky='ew', pady=10)
@@ -876,6 +4666,17 @@ class ModernCompactClinicSystem:
             cursor='hand2'
         ).pack(side='left', padx=10)
         
+        # Dispatch queue status
+        self.dispatch_status_label = tk.Label(
+            page,
+            text="",
+            bg=theme["bg_primary"],
+            fg=theme["text_secondary"],
+            font=self.fonts["small"],
+            anchor='w'
+        )
+        self.dispatch_status_label.pack(fill='x', padx=5)
+        
         # WhatsApp Activity Log
         log_frame = tk.LabelFrame(
             page,
@@ -886,6 +4687,45 @@ class ModernCompactClinicSystem:
         )
         log_frame.pack(fill='both', expand=True, padx=5, pady=5)
         
+        # Log filters (answered from the per-segment indexes, one page at a time)
+        filter_frame = tk.Frame(log_frame, bg=theme["bg_secondary"])
+        filter_frame.pack(fill='x', pady=(0, 5))
+        
+        self.log_filter_vars = {}
+        for key, label, width in [('patient', "Patient:", 14), ('phone', "Phone:", 12),
+                                  ('status', "Status:", 9), ('day', "Date (YYYY-MM-DD):", 11)]:
+            tk.Label(
+                filter_frame,
+                text=label,
+                bg=theme["bg_secondary"],
+                fg=theme["text_primary"],
+                font=self.fonts["small"]
+            ).pack(side='left', padx=(5, 2))
+            
+            self.log_filter_vars[key] = tk.StringVar()
+            entry = tk.Entry(
+                filter_frame,
+                textvariable=self.log_filter_vars[key],
+                width=width,
+                font=self.fonts["small"],
+                bg=theme["bg_primary"],
+                fg=theme["text_primary"]
+            )
+            entry.pack(side='left')
+            entry.bind('<Return>', lambda e: self.refresh_reminder_log())
+        
+        tk.Button(
+            filter_frame,
+            text="🔍 Filter",
+            command=self.refresh_reminder_log,
+            bg=theme["accent"],
+            fg="white",
+            font=self.fonts["small"],
+            relief='flat',
+            padx=10,
+            cursor='hand2'
+        ).pack(side='left', padx=5)
+        
         # Log treeview
         log_scroll = ttk.Scrollbar(log_frame)
         log_scroll.pack(side='right', fill='y')
@@ -900,7 +4740,7 @@ class ModernCompactClinicSystem:
         
         log_scroll.config(command=self.reminder_log_tree.yview)
         
-        for col, width in [('Time', 100), ('Patient', 120), ('Phone', 100), ('Type', 100), ('Status', 80)]:
+        for col, width in [('Time', 120), ('Patient', 120), ('Phone', 100), ('Type', 100), ('Status', 80)]:
             self.reminder_log_tree.heading(col, text=col)
             self.reminder_log_tree.column(col, width=width, anchor='center')
         
@@ -932,13 +4772,41 @@ class ModernCompactClinicSystem:
             relief='flat',
             padx=10,
             cursor='hand2'
-        ).pack(side='left', padx=5)
+        ).pack(side='left', padx=5)
+        
+        tk.Button(
+            control_frame,
+            text="📱 Test WhatsApp",
+            command=self.test_whatsapp_reminder,
+            bg=theme["success"],
+            fg="white",
+            font=self.fonts["small"],
+            relief='flat',
+            padx=10,
+            cursor='hand2'
+        ).pack(side='left', padx=5)
+        
+        tk.Button(
+            control_frame,
+            text="🚀 Send Now to All Today",
+            command=self.send_reminders_now,
+            bg=theme["danger"],
+            fg="white",
+            font=self.fonts["small"],
+            relief='flat',
+            padx=10,
+            cursor='hand2'
+        ).pack(side='right', padx=5)
+        
+        # Paging through older history
+        page_frame = tk.Frame(log_frame, bg=theme["bg_secondary"])
+        page_frame.pack(fill='x')
         
         tk.Button(
-            control_frame,
-            text="📱 Test WhatsApp",
-            command=self.test_whatsapp_reminder,
-            bg=theme["success"],
+            page_frame,
+            text="◀ Newer",
+            command=lambda: self.change_log_page(-1),
+            bg=theme["accent"],
             fg="white",
             font=self.fonts["small"],
             relief='flat',
@@ -947,16 +4815,25 @@ class ModernCompactClinicSystem:
         ).pack(side='left', padx=5)
         
         tk.Button(
-            control_frame,
-            text="🚀 Send Now to All Today",
-            command=self.send_reminders_now,
-            bg=theme["danger"],
+            page_frame,
+            text="Older ▶",
+            command=lambda: self.change_log_page(1),
+            bg=theme["accent"],
             fg="white",
             font=self.fonts["small"],
             relief='flat',
             padx=10,
             cursor='hand2'
-        ).pack(side='right', padx=5)
+        ).pack(side='left', padx=5)
+        
+        self.log_page_label = tk.Label(
+            page_frame,
+            text="",
+            bg=theme["bg_secondary"],
+            fg=theme["text_secondary"],
+            font=self.fonts["small"]
+        )
+        self.log_page_label.pack(side='left', padx=10)
 
     # AUTO-REMINDER SYSTEM METHODS WITH REAL WHATSAPP SENDING
     def start_reminder_system(self):
@@ -970,49 +4847,63 @@ class ModernCompactClinicSystem:
     def stop_reminder_system(self):
         """Stop the auto-reminder system"""
         self.reminder_running = False
+        self.reminder_scheduler.wake()
         if self.reminder_thread:
             self.reminder_thread = None
         self.log_reminder_activity("System", "", "Reminder system stopped", "INFO")
 
     def reminder_loop(self):
-        """Main reminder checking loop - checks every 5 minutes"""
+        """Main reminder loop - sleeps until the next reminder is due"""
         while self.reminder_running:
             try:
                 if self.reminder_settings["enabled"]:
                     self.check_and_send_reminders()
-                time.sleep(self.reminder_settings["check_interval"])  # Check every 5 minutes
+                # Wake for the earliest due reminder, a plan change, or at the latest
+                # after check_interval so settings changes are picked up
+                timeout = self.reminder_settings["check_interval"]
+                next_due = self.reminder_scheduler.next_due()
+                if next_due:
+                    timeout = min(timeout, max((next_due - datetime.now()).total_seconds(), 0.5))
+                self.reminder_scheduler.wait(timeout)
             except Exception as e:
                 self.log_reminder_activity("System", "", f"Error: {str(e)}", "ERROR")
                 time.sleep(60)  # Wait 1 minute before retrying
 
     def check_and_send_reminders(self):
-        """Check appointments and send WhatsApp reminders"""
+        """Send every reminder whose due time has passed"""
         now = datetime.now()
-        current_time = now.strftime("%H:%M")
-        
-        # Check if within business hours
-        if not self.is_business_hours(current_time):
-            return
-        
-        for appointment in self.appointments:
-            if not appointment.get('enable_reminders', True):
-                continue
-                
-            apt_datetime = self.get_appointment_datetime(appointment)
-            if not apt_datetime:
-                continue
+        self.prune_delivery_ledger()
+        for event in self.reminder_scheduler.pop_due(now):
+            _, expires, _, apt_id, reminder_type = event
+            if now > expires:
+                continue  # Window already closed
             
-            apt_id = appointment['id']
-            time_diff = apt_datetime - now
+            # Outside business hours: retry at the next opening, carrying the reminder
+            # past its window as long as the visit is still ahead
+            if not self.is_business_hours(now.strftime("%H:%M")):
+                opening = self.next_business_hours_start(now)
+                appointment = self.appointments.get(apt_id)
+                if appointment and appointment.datetime:
+                    expires = max(expires, appointment.datetime - CATCHUP_MIN_LEAD)
+                if opening and opening <= expires:
+                    self.reminder_scheduler.defer(event[:1] + (expires,) + event[2:], opening)
+                continue
             
-            # Check for different reminder types
-            self.check_reminder_type(appointment, apt_id, time_diff, "3_days", timedelta(days=3))
-            self.check_reminder_type(appointment, apt_id, time_diff, "1_day", timedelta(days=1))
-            self.check_reminder_type(appointment, apt_id, time_diff, "morning", timedelta(hours=12))
-            self.check_reminder_type(appointment, apt_id, time_diff, "1_hour", timedelta(hours=1))
-
-    def check_reminder_type(self, appointment, apt_id, time_diff, reminder_type, target_time):
-        """Check if a specific reminder type should be sent"""
+            appointment = self.appointments.get(apt_id)
+            if appointment and appointment.get('enable_reminders', True):
+                self.check_reminder_type(appointment, apt_id, reminder_type)
+
+    def next_business_hours_start(self, now):
+        """Next datetime at which business hours open, or None if unparseable"""
+        try:
+            start = datetime.strptime(self.reminder_settings["business_hours_start"], '%H:%M').time()
+        except (KeyError, ValueError):
+            return None
+        opening = datetime.combine(now.date(), start)
+        return opening if opening > now else opening + timedelta(days=1)
+
+    def check_reminder_type(self, appointment, apt_id, reminder_type):
+        """Send a due reminder on every channel that has not delivered it yet"""
         setting_key = f"remind_{reminder_type}" if reminder_type != "morning" else "remind_morning"
         
         if not self.reminder_settings.get(setting_key, True):
@@ -1020,87 +4911,334 @@ class ModernCompactClinicSystem:
         
         reminder_key = f"{apt_id}_{reminder_type}"
         
-        # Check if already sent
-        if reminder_key in self.sent_reminders:
-            return
+        # Hand off to the channel queues; the result comes back in on_dispatch_result
+        channels = ["whatsapp"]
+        if appointment.get('enable_email', True) and appointment.get('email'):
+            channels.append("email")
+        
+        with self._inflight_lock:
+            in_flight = self._inflight_reminders.get(reminder_key, set())
+            # Each channel is tracked on its own: a sent WhatsApp does not stop a retried email
+            channels = [channel for channel in channels if channel not in in_flight
+                        and self.delivery_ledger.status(apt_id, reminder_type, channel) is None]
+            if not channels:
+                return
+            self._inflight_reminders[reminder_key] = in_flight | set(channels)
         
-        # Check if it's time to send
-        should_send = False
-        
-        if reminder_type == "morning":
-            # Send morning reminder if appointment is today and it's morning (8-10 AM)
-            if time_diff.days == 0 and 8 <= datetime.now().hour <= 10:
-                should_send = True
-        elif reminder_type == "1_hour":
-            # Send 1 hour reminder with 30-minute tolerance
-            if timedelta(minutes=30) <= time_diff <= timedelta(hours=1, minutes=30):
-                should_send = True
+        for channel in channels:
+            outbox_id = self.outbox.add(channel, apt_id, reminder_type, reminder_key)
+            self.submit_reminder_job(DispatchJob(channel, appointment, reminder_type, reminder_key, outbox_id))
+
+    def submit_reminder_job(self, job):
+        """Send through the async engine when enabled, else the per-channel queue"""
+        if self.notification_engine is not None:
+            self.notification_engine.submit(job)
         else:
-            # For 3-day and 1-day reminders, check with 6-hour tolerance
-            tolerance = timedelta(hours=6)
-            if abs(time_diff - target_time) <= tolerance:
-                should_send = True
-        
-            # Add this to your check_reminder_type method after WhatsApp sending
-        if should_send:
-            # Send WhatsApp
-            whatsapp_success = self.send_auto_whatsapp_reminder(appointment, reminder_type)
-            
-            # Send Email
-            email_success = False
-            if appointment.get('enable_email', True) and appointment.get('email'):
-                email_success = self.send_email_reminder(appointment, reminder_type)
-                if email_success:
-                    time.sleep(self.email_settings.get("email_delay", 2))
+            self.dispatchers[job.channel].submit(job)
+
+    def start_notification_engine(self):
+        """Start the asyncio engine and poll its results on the Tk thread"""
+        if self.notification_engine is not None:
+            return
+        engine = AsyncNotificationEngine({
+            "email": 10,
+            "http": 20,
+            "whatsapp": self.whatsapp_transport.max_parallel
+        })
+        # Same send rate as the per-channel queues
+        engine.register("whatsapp", self.send_whatsapp_reminder_async, self.dispatchers["whatsapp"].bucket)
+        engine.register("email", self.send_email_reminder_async, self.dispatchers["email"].bucket)
+        self.notification_engine = engine
+        self.engine_stats = {"sent": 0, "failed": 0, "avg_latency": 0.0}
+        self.process_engine_results()
+
+    def toggle_async_engine(self):
+        """Switch between the async engine and the per-channel queues"""
+        self.save_reminder_settings()
+        if self.reminder_settings.get("async_engine"):
+            self.start_notification_engine()
+            self.show_toast("Async notification engine enabled! ⚡", "info")
+        else:
+            self.stop_notification_engine()
+            self.show_toast("Using rate-limited send queues", "info")
+
+    def stop_notification_engine(self):
+        if self.notification_engine is not None:
+            self.notification_engine.stop()
+            self.notification_engine = None
+
+    def process_engine_results(self):
+        """Drain results handed back by the engine thread"""
+        engine = self.notification_engine
+        if engine is None:
+            return
+        while True:
+            try:
+                job, success, latency = engine.results.get_nowait()
+            except queue.Empty:
+                break
+            self.engine_stats["sent" if success else "failed"] += 1
+            self.engine_stats["avg_latency"] = latency if not self.engine_stats["avg_latency"] else (
+                0.8 * self.engine_stats["avg_latency"] + 0.2 * latency)
+            self.on_dispatch_result(job, success)
+        self.root.after(500, self.process_engine_results)
+
+    async def send_whatsapp_reminder_async(self, job):
+        """API transport: non-blocking POST on the engine loop; browser method: blocking send in the executor"""
+        transport = self.whatsapp_transport
+        if not isinstance(transport, WhatsAppAPITransport) or not self.reminder_settings.get("auto_send_whatsapp", True):
+            return await self.notification_engine.run_blocking(
+                self.send_auto_whatsapp_reminder, job.appointment, job.reminder_type)
+        
+        appointment, reminder_type = job.appointment, job.reminder_type
+        prepared = self.prepare_whatsapp_reminder(appointment, reminder_type)
+        if prepared is None:
+            return False
+        clean_phone, message = prepared
+        try:
+            status, body = await self.notification_engine.post_json(
+                transport.api_url, transport.build_payload(clean_phone, message),
+                transport.headers, transport.timeout)
+            if not 200 <= status < 300:
+                raise WhatsAppAPIError(status, body)
+        except Exception as e:
+            job.error = str(e)
+            return self.finish_whatsapp_reminder(appointment, reminder_type, clean_phone, False, job.error)
+        return self.finish_whatsapp_reminder(appointment, reminder_type, clean_phone, True)
+
+    async def send_email_reminder_async(self, job):
+        """Email reminder over aiosmtplib, or the pooled blocking sender without it"""
+        if not AIOSMTPLIB_AVAILABLE or not self.email_settings.get("auto_send_email", True):
+            return await self.notification_engine.run_blocking(
+                self.send_email_reminder, job.appointment, job.reminder_type)
+        
+        appointment, reminder_type = job.appointment, job.reminder_type
+        email = appointment.get('email', '').strip()
+        if not email or not self.validate_email(email):
+            return False
+        try:
+            message = self.smtp_pool.build_message(
+                email,
+                self.get_email_subject(appointment, reminder_type),
+                self.get_email_body(appointment, reminder_type)
+            )
+            await self.notification_engine.send_email(self.email_settings, message)
+            self.log_reminder_activity(
+                appointment['patient_name'], 
+                email,
+                f"{reminder_type.replace('_', ' ').title()} email reminder sent", 
+                "SENT 📧"
+            )
+            return True
+        except Exception as e:
+            self.log_reminder_activity(
+                appointment['patient_name'], 
+                email,
+                f"Error sending {reminder_type} email: {str(e)}", 
+                "ERROR ❌"
+            )
+            return False
+
+    def setup_dispatchers(self):
+        """Start one rate-limited send queue per channel"""
+        self.dispatchers = {
+            "whatsapp": ChannelDispatcher(
+                "whatsapp",
+                lambda job: self.send_auto_whatsapp_reminder(job.appointment, job.reminder_type),
+                self.reminder_settings.get("whatsapp_delay", 3),
+                self.on_dispatch_result,
+                send_batch=self.send_whatsapp_batch,
+                batch_size=self.whatsapp_transport.max_parallel
+            ),
+            "email": ChannelDispatcher(
+                "email",
+                lambda job: self.send_email_reminder(job.appointment, job.reminder_type),
+                self.email_settings.get("email_delay", 2),
+                self.on_dispatch_result,
+                # Log out of SMTP sessions once a reminder burst is over
+                on_idle=self.smtp_pool.close_idle
+            )
+        }
+
+    def on_dispatch_result(self, job, success):
+        """Called on a dispatch worker: record the channel's outcome in the delivery ledger"""
+        if not job.reminder_key:
+            return
+        apt_id = job.appointment['id']
+        apt_date = job.appointment.get('appointment_date', '')
+        if success:
+            self.delivery_ledger.record(apt_id, job.reminder_type, job.channel, "sent", apt_date)
+            if job.outbox_id:
+                self.outbox.succeeded(job.outbox_id)
+        elif job.outbox_id:
+            retry_at = self.outbox.failed(job.outbox_id, job.error or "send failed")
+            if retry_at is not None:
+                self.log_reminder_activity(
+                    job.appointment['patient_name'],
+                    "",
+                    f"{job.reminder_type.replace('_', ' ').title()} {job.channel} reminder will be retried at {retry_at:%H:%M}",
+                    "RETRY 🔁"
+                )
+                return  # This channel stays in flight until the retry
+            self.log_reminder_activity(
+                job.appointment['patient_name'],
+                "",
+                f"Gave up on {job.reminder_type} {job.channel} reminder after {self.outbox.max_attempts} attempts",
+                "FAILED ❌"
+            )
+            self.delivery_ledger.record(apt_id, job.reminder_type, job.channel, "failed", apt_date)
+        self.release_inflight(job.reminder_key, job.channel)
+
+    def release_inflight(self, reminder_key, channel):
+        """A channel finished (or dropped) its part of a reminder"""
+        with self._inflight_lock:
+            remaining = self._inflight_reminders.get(reminder_key, set())
+            remaining.discard(channel)
+            if not remaining:
+                self._inflight_reminders.pop(reminder_key, None)
+
+    def run_reminder_catchup(self):
+        """Queue reminders whose windows closed while the app was not running"""
+        last_heartbeat = self.store.get_meta('last_heartbeat')
+        if not last_heartbeat:
+            return
+        try:
+            since = datetime.fromisoformat(last_heartbeat)
+        except ValueError:
+            return
+        now = datetime.now()
+        missed = missed_reminders(self.appointments, since, now)
+        for appointment, reminder_type in missed:
+            # check_reminder_type still applies the type settings and the delivery ledger
+            self.reminder_scheduler.add_catchup(
+                appointment['id'], reminder_type, now, appointment.datetime - CATCHUP_MIN_LEAD)
+        if missed:
+            self.log_reminder_activity(
+                "System", "",
+                f"Catch-up: {len(missed)} reminder(s) missed since {since:%Y-%m-%d %H:%M} queued",
+                "INFO"
+            )
+
+    def resume_outbox(self):
+        """Put messages left pending by the last run back in flight and start retrying"""
+        pending = self.outbox.resume()
+        with self._inflight_lock:
+            for entry in pending:
+                self._inflight_reminders.setdefault(entry['reminder_key'], set()).add(entry['channel'])
+        if pending:
+            self.log_reminder_activity("System", "", f"Resumed {len(pending)} pending reminder message(s) from the outbox", "INFO")
+
+    def retry_outbox_entry(self, entry):
+        """Outbox retry thread: resend a pending message if it still makes sense"""
+        appointment = self.appointments.get(entry['apt_id'])
+        now = datetime.now()
+        apt_datetime = self.get_appointment_datetime(appointment) if appointment else None
+        if (apt_datetime is None or apt_datetime <= now
+                or not appointment.get('enable_reminders', True)):
+            # Deleted, already past, or reminders switched off meanwhile
+            self.outbox.discard(entry['message_id'])
+            self.release_inflight(entry['reminder_key'], entry['channel'])
+            return
+        
+        if not self.is_business_hours(now.strftime("%H:%M")):
+            opening = self.next_business_hours_start(now)
+            if opening:
+                self.outbox.postpone(entry['message_id'], opening)
+                return
+        
+        self.submit_reminder_job(DispatchJob(
+            entry['channel'], appointment, entry['reminder_type'], entry['reminder_key'], entry['message_id']))
+
+    def update_dispatch_status(self):
+        """Show queue depth and send latency on the reminders page"""
+        if hasattr(self, 'dispatch_status_label'):
+            parts = []
+            for channel, label in (("whatsapp", "📱 WhatsApp"), ("email", "📧 Email")):
+                dispatcher = self.dispatchers[channel]
+                stats = dispatcher.stats
+                parts.append(f"{label}: {dispatcher.depth()} queued, {stats['sent']} sent, "
+                             f"{stats['failed']} failed, avg {stats['avg_latency']:.1f}s")
+            if self.notification_engine is not None:
+                stats = self.engine_stats
+                parts.append(f"⚡ Async: {stats['sent']} sent, {stats['failed']} failed, "
+                             f"avg {stats['avg_latency']:.1f}s")
+            parts.append(f"🔁 Outbox: {self.outbox.pending()} pending")
+            self.dispatch_status_label.config(text="   |   ".join(parts))
+        self.root.after(2000, self.update_dispatch_status)
+
+    def create_whatsapp_transport(self):
+        """Business API transport when configured, otherwise the browser method"""
+        if self.reminder_settings.get("whatsapp_transport") == "api":
+            api_url = self.reminder_settings.get("whatsapp_api_url", "").strip()
+            token = self.reminder_settings.get("whatsapp_api_token", "").strip()
+            if api_url and token:
+                try:
+                    return WhatsAppAPITransport(
+                        api_url, token,
+                        max_connections=self.reminder_settings.get("whatsapp_api_connections", 4)
+                    )
+                except ValueError as e:
+                    print(f"WhatsApp API transport disabled: {e}")
+            else:
+                print("WhatsApp API URL or token missing - falling back to browser sending")
+        return BrowserWhatsAppTransport(self.send_whatsapp_message_auto)
+
+    def set_whatsapp_transport(self, transport):
+        """Swap the transport used by new sends and close the old one"""
+        old_transport, self.whatsapp_transport = self.whatsapp_transport, transport
+        if hasattr(self, 'dispatchers'):
+            self.dispatchers["whatsapp"].batch_size = transport.max_parallel
+        old_transport.close()
+
+    def prepare_whatsapp_reminder(self, appointment, reminder_type):
+        """(clean phone, message) for a reminder, or None after logging a bad number"""
+        # Phone number is cleaned once when the record is loaded or edited
+        clean_phone = Appointment.from_dict(appointment).clean_phone
+        if not clean_phone:
+            self.log_reminder_activity(
+                appointment['patient_name'], 
+                appointment['phone_number'],
+                f"Invalid phone number for {reminder_type} reminder", 
+                "ERROR"
+            )
+            return None
+        return clean_phone, self.get_reminder_message(appointment, reminder_type)
+
+    def finish_whatsapp_reminder(self, appointment, reminder_type, clean_phone, success, error=None):
+        """Log the outcome of a WhatsApp send and show the notification"""
+        if success:
+            self.log_reminder_activity(
+                appointment['patient_name'], 
+                clean_phone,
+                f"{reminder_type.replace('_', ' ').title()} reminder sent via WhatsApp", 
+                "SENT ✅"
+            )
             
-            # Mark as sent if either succeeded
-            if whatsapp_success or email_success:
-                self.sent_reminders[reminder_key] = datetime.now().isoformat()
-                self.save_reminder_data()
+            # Show background notification
+            self.show_whatsapp_notification(appointment, reminder_type)
+            return True
+        
+        self.log_reminder_activity(
+            appointment['patient_name'], 
+            clean_phone,
+            f"Failed to send {reminder_type} reminder" + (f": {error}" if error else ""), 
+            "FAILED ❌"
+        )
+        return False
 
     def send_auto_whatsapp_reminder(self, appointment, reminder_type):
         """Send automatic WhatsApp reminder - REAL WHATSAPP SENDING!"""
+        phone = appointment.get('phone_number', '')
         try:
-            message = self.get_reminder_message(appointment, reminder_type)
-            phone = appointment['phone_number']
-            
-            # Clean and format phone number
-            clean_phone = self.clean_phone_number(phone)
-            if not clean_phone:
-                self.log_reminder_activity(
-                    appointment['patient_name'], 
-                    phone,
-                    f"Invalid phone number for {reminder_type} reminder", 
-                    "ERROR"
-                )
+            prepared = self.prepare_whatsapp_reminder(appointment, reminder_type)
+            if prepared is None:
                 return False
+            clean_phone, message = prepared
             
             # Send WhatsApp message
             if self.reminder_settings.get("auto_send_whatsapp", True):
-                success = self.send_whatsapp_message_auto(clean_phone, message)
-                
-                if success:
-                    self.log_reminder_activity(
-                        appointment['patient_name'], 
-                        clean_phone,
-                        f"{reminder_type.replace('_', ' ').title()} reminder sent via WhatsApp", 
-                        "SENT ✅"
-                    )
-                    
-                    # Show background notification
-                    self.root.after(0, lambda: self.show_whatsapp_notification(appointment, reminder_type))
-                    
-                    # Add delay between messages
-                    time.sleep(self.reminder_settings.get("whatsapp_delay", 3))
-                    return True
-                else:
-                    self.log_reminder_activity(
-                        appointment['patient_name'], 
-                        clean_phone,
-                        f"Failed to send {reminder_type} reminder", 
-                        "FAILED ❌"
-                    )
-                    return False
+                success = self.whatsapp_transport.send(clean_phone, message)
+                return self.finish_whatsapp_reminder(appointment, reminder_type, clean_phone, success)
             else:
                 # Just log that reminder would be sent
                 self.log_reminder_activity(
@@ -1120,6 +5258,30 @@ class ModernCompactClinicSystem:
             )
             return False
 
+    def send_whatsapp_batch(self, jobs):
+        """Dispatcher batch: every waiting reminder goes out in one transport.send_batch call"""
+        if not self.reminder_settings.get("auto_send_whatsapp", True):
+            return [self.send_auto_whatsapp_reminder(job.appointment, job.reminder_type) for job in jobs]
+        
+        results = [False] * len(jobs)
+        prepared = []
+        for i, job in enumerate(jobs):
+            try:
+                item = self.prepare_whatsapp_reminder(job.appointment, job.reminder_type)
+            except Exception as e:
+                job.error = str(e)
+                item = None
+            if item is not None:
+                prepared.append((i, item))
+        
+        outcomes = self.whatsapp_transport.send_batch([item for _, item in prepared])
+        for (i, (clean_phone, _)), (success, error) in zip(prepared, outcomes):
+            job = jobs[i]
+            job.error = error
+            results[i] = self.finish_whatsapp_reminder(
+                job.appointment, job.reminder_type, clean_phone, success, error)
+        return results
+
     def send_whatsapp_message_auto(self, phone_number, message):
         """Actually send WhatsApp message automatically"""
         try:
@@ -1186,21 +5348,7 @@ class ModernCompactClinicSystem:
 
     def clean_phone_number(self, phone):
         """Clean and format phone number for WhatsApp"""
-        if not phone or not phone.strip():
-            return None
-        
-        # Remove all non-digit characters except +
-        clean = re.sub(r'[^\d+]', '', phone.strip())
-        
-        # If no country code, add default (change +1 to your country code)
-        if not clean.startswith('+'):
-            # Remove leading zeros
-            clean = clean.lstrip('0')
-            # Add country code (change +1 to your country code)
-            clean = '+1' + clean
-        
-        # Remove + for WhatsApp URL (wa.me expects numbers without +)
-        return clean.replace('+', '')
+        return clean_phone_number(phone)
 
     def get_reminder_message(self, appointment, reminder_type):
         """Generate reminder message based on type"""
@@ -1222,9 +5370,9 @@ class ModernCompactClinicSystem:
         return messages.get(reminder_type, f"Hi {name}, reminder about your {procedure} appointment.")
 
     def show_whatsapp_notification(self, appointment, reminder_type):
-        """Show background notification for sent WhatsApp"""
+        """Queue a notification for a sent WhatsApp (safe from any thread)"""
         message = f"📱 WhatsApp sent to {appointment['patient_name']} ({reminder_type.replace('_', ' ').title()} reminder)"
-        self.show_toast(message, "success")
+        self.ui_events.publish("toast", (message, "success"))
 
     def toggle_whatsapp_auto_send(self):
         """Toggle automatic WhatsApp sending"""
@@ -1243,14 +5391,14 @@ class ModernCompactClinicSystem:
             return
         
         # Find an appointment or create test data
-        test_apt = self.appointments[0].copy() if self.appointments else {
+        test_apt = self.appointments.first().copy() if self.appointments else Appointment({
             'id': 999,
             'patient_name': 'TEST PATIENT',
             'procedure': 'TEST PROCEDURE',
             'phone_number': '+1234567890',  # Use a test number
             'appointment_date': datetime.now().strftime('%Y-%m-%d'),
             'appointment_time': (datetime.now() + timedelta(hours=1)).strftime('%H:%M')
-        }
+        })
         
         # Ask user for confirmation
         if messagebox.askyesno(
@@ -1269,9 +5417,8 @@ class ModernCompactClinicSystem:
     def send_reminders_now(self):
         """Send reminders to all today's appointments immediately"""
         today = datetime.now().strftime('%Y-%m-%d')
-        today_appointments = [apt for apt in self.appointments 
-                            if apt.get('appointment_date') == today 
-                            and apt.get('enable_reminders', True)]
+        today_appointments = [apt for apt in self.appointments.on_date(today)
+                            if apt.get('enable_reminders', True)]
         
         if not today_appointments:
             self.show_toast("No appointments with reminders enabled for today!", "warning")
@@ -1281,32 +5428,15 @@ class ModernCompactClinicSystem:
             "Send Reminders Now", 
             f"This will send WhatsApp reminders to {len(today_appointments)} patients with appointments today.\n\nContinue?"
         ):
-            sent_count = 0
+            # The WhatsApp queue paces the sends; results show up in the activity log
             for apt in today_appointments:
-                success = self.send_auto_whatsapp_reminder(apt, "manual")
-                if success:
-                    sent_count += 1
-                # Small delay between messages
-                time.sleep(self.reminder_settings.get("whatsapp_delay", 3))
+                self.submit_reminder_job(DispatchJob("whatsapp", apt, "manual"))
             
-            self.show_toast(f"Sent {sent_count}/{len(today_appointments)} WhatsApp reminders!", "success")
+            self.show_toast(f"Queued {len(today_appointments)} WhatsApp reminders!", "success")
 
     def get_appointment_datetime(self, appointment):
-        """Get appointment datetime object"""
-        try:
-            date_str = appointment.get('appointment_date')
-            time_str = appointment.get('appointment_time', '09:00')
-            
-            if not date_str:
-                return None
-            
-            # Parse date and time
-            appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-            appointment_time = datetime.strptime(time_str, '%H:%M').time()
-            
-            return datetime.combine(appointment_date, appointment_time)
-        except:
-            return None
+        """Get appointment datetime object (parsed once when the record is loaded or edited)"""
+        return Appointment.from_dict(appointment).datetime
 
     def is_business_hours(self, current_time):
         """Check if current time is within business hours"""
@@ -1368,80 +5498,134 @@ class ModernCompactClinicSystem:
         """Log reminder activity with phone number"""
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        # Add to log file
-        try:
-            with open('whatsapp_reminder_log.txt', 'a', encoding='utf-8') as f:
-                f.write(f"{timestamp} | {patient} | {phone} | {activity} | {status}\n")
-        except:
-            pass
-        
-        # Update UI log if on reminders page
-        if hasattr(self, 'reminder_log_tree'):
-            self.root.after(0, lambda: self.add_log_entry(timestamp, patient, phone, activity, status))
+        # Queue for the background log writer
+        self.reminder_logger.log(timestamp, patient, phone, activity, status)
+        
+        # Update UI log on the next event bus drain (this may be a worker thread)
+        self.ui_events.publish("log", (timestamp, patient, phone, activity, status))
+
+    def pump_ui_events(self):
+        """Drain events published by background threads, at a fixed cadence"""
+        self.ui_events.drain()
+        self.root.after(UI_EVENT_INTERVAL_MS, self.pump_ui_events)
+
+    def format_log_row(self, row):
+        """Tree values for one log row; entries from earlier days keep their date"""
+        timestamp, patient, phone, activity, status = row
+        today = date.today().strftime('%Y-%m-%d')
+        shown_time = timestamp.split(' ')[1] if timestamp.startswith(today + ' ') else timestamp[:16]
+        return (
+            shown_time,
+            patient[:12] + "..." if len(patient) > 12 else patient,
+            phone[:12] + "..." if len(phone) > 12 else phone,
+            activity[:15] + "..." if len(activity) > 15 else activity,
+            status
+        )
 
-    def add_log_entry(self, timestamp, patient, phone, activity, status):
-        """Add entry to reminder log tree"""
+    def log_filters(self):
+        """Current log filter entries, without the blank ones"""
+        if not hasattr(self, 'log_filter_vars'):
+            return {}
+        return {key: var.get().strip() for key, var in self.log_filter_vars.items() if var.get().strip()}
+
+    def add_log_entries(self, rows):
+        """Add a burst of log rows to the reminder log tree in one update"""
+        if not hasattr(self, 'reminder_log_tree'):
+            return
+        # Live rows only belong on the newest, unfiltered page
+        if self.log_page or self.log_filters():
+            return
         try:
-            time_only = timestamp.split(' ')[1]  # Time only
-            patient_short = patient[:12] + "..." if len(patient) > 12 else patient
-            phone_short = phone[:12] + "..." if len(phone) > 12 else phone
-            activity_short = activity[:15] + "..." if len(activity) > 15 else activity
-            
-            self.reminder_log_tree.insert('', 0, values=(
-                time_only,
-                patient_short,
-                phone_short,
-                activity_short,
-                status
-            ))
+            # Only the newest 100 are shown, so older rows of a big burst are skipped
+            for row in rows[-100:]:
+                self.reminder_log_tree.insert('', 0, values=self.format_log_row(row))
             
             # Keep only last 100 entries
             children = self.reminder_log_tree.get_children()
             if len(children) > 100:
-                for item in children[100:]:
-                    self.reminder_log_tree.delete(item)
+                self.reminder_log_tree.delete(*children[100:])
         except:
             pass
 
-    def refresh_reminder_log(self):
-        """Refresh the reminder log display"""
-        # Clear current log
+    def show_toast_batch(self, toasts):
+        """One toast per drain: a single message as is, a burst as a summary"""
+        if len(toasts) == 1:
+            self.show_toast(*toasts[0])
+            return
+        severity = ["info", "success", "warning", "error"]
+        worst = max((toast_type for _, toast_type in toasts), key=severity.index)
+        self.show_toast(f"{toasts[-1][0]}\n…and {len(toasts) - 1} more updates (see the reminder log)", worst)
+
+    def migrate_reminder_log(self):
+        """Move rows from the old text log into the JSON Lines log, once"""
+        if not os.path.exists(LEGACY_LOG_FILE):
+            return
+        rows = read_legacy_log_text(LEGACY_LOG_FILE)
+        os.replace(LEGACY_LOG_FILE, LEGACY_LOG_FILE + '.migrated')
+        if rows:
+            self.reminder_logger.import_rows(rows)
+
+    def refresh_reminder_log(self, page=0):
+        """Load one page of the reminder log on a worker thread"""
+        self.log_page = page = max(page, 0)
+        self.log_query_serial += 1
+        serial, filters = self.log_query_serial, self.log_filters()
+        if hasattr(self, 'log_page_label'):
+            self.log_page_label.config(text="Loading…")
+        
+        def load():
+            started = time.perf_counter()
+            try:
+                self.reminder_logger.flush()
+                if page == 0 and not filters:
+                    # The newest page is read straight off the end of the log; no index needed
+                    rows, total = self.reminder_logger.tail(LOG_PAGE_SIZE), None
+                else:
+                    rows, total = self.reminder_logger.query(page=page, page_size=LOG_PAGE_SIZE, **filters)
+            except Exception as e:
+                print(f"Reminder log query error: {e}")
+                rows, total = [], 0
+            self.ui_events.publish("log_page", (serial, rows, total, time.perf_counter() - started))
+        
+        threading.Thread(target=load, name="reminder-log-query", daemon=True).start()
+
+    def show_log_page(self, results):
+        """Show the newest finished log query, if it is still the one wanted"""
+        serial, rows, total, elapsed = results[-1]
+        if serial != self.log_query_serial:
+            return
         for item in self.reminder_log_tree.get_children():
             self.reminder_log_tree.delete(item)
-        
-        # Load from file
-        try:
-            if os.path.exists('whatsapp_reminder_log.txt'):
-                with open('whatsapp_reminder_log.txt', 'r', encoding='utf-8') as f:
-                    lines = f.readlines()[-100:]  # Last 100 entries
-                    
-                for line in reversed(lines):
-                    parts = line.strip().split(' | ')
-                    if len(parts) >= 5:
-                        timestamp, patient, phone, activity, status = parts[:5]
-                        time_only = timestamp.split(' ')[1]
-                        self.reminder_log_tree.insert('', 'end', values=(
-                            time_only,
-                            patient[:12] + "..." if len(patient) > 12 else patient,
-                            phone[:12] + "..." if len(phone) > 12 else phone,
-                            activity[:15] + "..." if len(activity) > 15 else activity,
-                            status
-                        ))
-        except:
-            pass
+        for row in rows:
+            self.reminder_log_tree.insert('', 'end', values=self.format_log_row(row))
+        if total is None:
+            text = f"Newest {len(rows)} entries"
+        else:
+            pages = max((total + LOG_PAGE_SIZE - 1) // LOG_PAGE_SIZE, 1)
+            text = f"Page {self.log_page + 1} of {pages} · {total} entries · {elapsed * 1000:.0f} ms"
+        self.log_page_label.config(text=text)
+        self.log_page_total = total
+
+    def change_log_page(self, step):
+        """Move to a newer (-1) or older (+1) page of the log"""
+        page = self.log_page + step
+        total = getattr(self, 'log_page_total', None)
+        if page < 0 or (total is not None and page * LOG_PAGE_SIZE >= total) or (
+                total is None and step > 0 and len(self.reminder_log_tree.get_children()) < LOG_PAGE_SIZE):
+            return
+        self.refresh_reminder_log(page)
 
     def clear_reminder_log(self):
         """Clear the reminder log"""
         if messagebox.askyesno("Clear Log", "Are you sure you want to clear the WhatsApp reminder log?"):
-            # Clear file
+            # Delete the log files
             try:
-                open('whatsapp_reminder_log.txt', 'w').close()
-            except:
+                self.reminder_logger.clear()
+            except OSError:
                 pass
             
-            # Clear tree
-            for item in self.reminder_log_tree.get_children():
-                self.reminder_log_tree.delete(item)
+            # Back to an empty first page
+            self.refresh_reminder_log()
             
             self.show_toast("WhatsApp reminder log cleared!", "info")
 
@@ -1455,6 +5639,9 @@ class ModernCompactClinicSystem:
         if hasattr(self, 'auto_whatsapp_var'):
             self.reminder_settings["auto_send_whatsapp"] = self.auto_whatsapp_var.get()
         
+        if hasattr(self, 'async_engine_var'):
+            self.reminder_settings["async_engine"] = self.async_engine_var.get()
+        
         if hasattr(self, 'start_time_var'):
             self.reminder_settings["business_hours_start"] = self.start_time_var.get()
         
@@ -1467,40 +5654,53 @@ class ModernCompactClinicSystem:
             except:
                 self.reminder_settings["whatsapp_delay"] = 3
         
+        transport_keys = ("whatsapp_transport", "whatsapp_api_url", "whatsapp_api_token")
+        old_transport_config = [self.reminder_settings.get(key) for key in transport_keys]
+        if hasattr(self, 'whatsapp_transport_var'):
+            self.reminder_settings["whatsapp_transport"] = self.whatsapp_transport_var.get()
+            self.reminder_settings["whatsapp_api_url"] = self.whatsapp_api_url_var.get().strip()
+            self.reminder_settings["whatsapp_api_token"] = self.whatsapp_api_token_var.get().strip()
+        
         try:
-            with open('whatsapp_reminder_settings.json', 'w') as f:
-                json.dump(self.reminder_settings, f, indent=2)
-        except:
-            pass
+            atomic_write_json('whatsapp_reminder_settings.json', self.reminder_settings)
+        except Exception as e:
+            print(f"Could not save reminder settings: {e}")
+        
+        if hasattr(self, 'whatsapp_transport') and old_transport_config != [
+                self.reminder_settings.get(key) for key in transport_keys]:
+            self.set_whatsapp_transport(self.create_whatsapp_transport())
+        
+        if hasattr(self, 'dispatchers'):
+            self.dispatchers["whatsapp"].bucket.set_interval(self.reminder_settings.get("whatsapp_delay", 3))
         
+        # The plan covers every reminder type (disabled ones are skipped when due), so keep the
+        # heap with its deferred and catch-up entries and just let the reminder thread re-check
+        self.reminder_scheduler.wake()
         self.update_reminder_status()
 
     def load_reminder_data(self):
-        """Load reminder settings and sent reminders"""
+        """Load reminder settings and the delivery ledger"""
         # Load settings
-        try:
-            if os.path.exists('whatsapp_reminder_settings.json'):
-                with open('whatsapp_reminder_settings.json', 'r') as f:
-                    saved_settings = json.load(f)
-                    self.reminder_settings.update(saved_settings)
-        except:
-            pass
+        self.reminder_settings.update(load_json_state('whatsapp_reminder_settings.json', {}))
         
-        # Load sent reminders
+        # Load delivery ledger
         try:
-            if os.path.exists('sent_whatsapp_reminders.json'):
-                with open('sent_whatsapp_reminders.json', 'r') as f:
-                    self.sent_reminders = json.load(f)
-        except:
-            pass
+            self.delivery_ledger.load()
+            self.prune_delivery_ledger()
+        except Exception as e:
+            print(f"Could not load delivery ledger: {e}")
 
-    def save_reminder_data(self):
-        """Save sent reminders data"""
-        try:
-            with open('sent_whatsapp_reminders.json', 'w') as f:
-                json.dump(self.sent_reminders, f, indent=2)
-        except:
-            pass
+    def prune_delivery_ledger(self):
+        """Drop ledger rows for appointments past the TTL or deleted (once a day)"""
+        today = date.today()
+        if self._ledger_pruned_on == today:
+            return
+        self._ledger_pruned_on = today
+        cutoff = today - timedelta(days=self.reminder_settings.get("ledger_ttl_days", 30))
+        live_ids = {apt['id'] for apt in self.appointments}
+        pruned = self.delivery_ledger.prune(cutoff.strftime('%Y-%m-%d'), live_ids)
+        if pruned:
+            print(f"Pruned {pruned} old delivery ledger entries")
 
     # Continue with all your existing methods but I'll add the key ones for the UI...
     
@@ -1954,8 +6154,8 @@ class ModernCompactClinicSystem:
             full_procedure += f": {procedure_details}"
             
         # Add email to the appointment object
-        appointment = {
-            'id': len(self.appointments) + 1,
+        appointment = Appointment({
+            'id': self.appointments.allocate_id(),
             'patient_name': name,
             'procedure': full_procedure,
             'phone_number': phone1,
@@ -1968,12 +6168,13 @@ class ModernCompactClinicSystem:
             'enable_email': enable_email,  # ADD THIS LINE
             'notes': notes,
             'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+        })
                 
         # Save the appointment with proper error handling
         try:
-            self.appointments.append(appointment)
-            self.save_data()
+            self.appointments.add(appointment)
+            self.change_tracker.mark_appointment(appointment)
+            self.change_tracker.mark_meta('next_appointment_id', self.appointments.next_id)
             self.update_stats()
             
             # Log appointment creation
@@ -2144,6 +6345,44 @@ class ModernCompactClinicSystem:
         self.create_quick_button(controls, "🗑️", self.delete_appointment, "Delete Selected")
         self.create_quick_button(controls, "📱", self.send_manual_whatsapp, "Send Manual WhatsApp")
         
+        # Filter expression, e.g. procedure:MRI date:2025-06-01..2025-06-30 reminders:off
+        filter_bar = tk.Frame(page, bg=theme["bg_primary"])
+        filter_bar.pack(fill='x', pady=(0, 5))
+        
+        tk.Label(
+            filter_bar,
+            text="Filter:",
+            font=self.fonts["body"],
+            bg=theme["bg_primary"],
+            fg=theme["text_primary"]
+        ).pack(side='left')
+        
+        self.view_filter_var = tk.StringVar()
+        filter_entry = tk.Entry(
+            filter_bar,
+            textvariable=self.view_filter_var,
+            font=self.fonts["body"],
+            bg=theme["bg_secondary"],
+            fg=theme["text_primary"],
+            relief='flat',
+            bd=1,
+            insertbackground=theme["text_primary"]
+        )
+        filter_entry.pack(side='left', fill='x', expand=True, padx=(10, 5))
+        filter_entry.bind('<Return>', lambda e: self.apply_view_filter())
+        
+        self.create_quick_button(filter_bar, "🔍", self.apply_view_filter, "Apply Filter")
+        self.create_quick_button(filter_bar, "❌", self.clear_view_filter, "Clear Filter")
+        
+        self.view_filter_label = tk.Label(
+            filter_bar,
+            text="",
+            font=self.fonts["small"],
+            bg=theme["bg_primary"],
+            fg=theme["text_secondary"]
+        )
+        self.view_filter_label.pack(side='left', padx=5)
+        
         # Compact treeview
         tree_frame = tk.Frame(page, bg=theme["bg_secondary"], relief='flat', bd=1)
         tree_frame.pack(fill='both', expand=True)
@@ -2160,12 +6399,10 @@ class ModernCompactClinicSystem:
             tree_frame,
             columns=('ID', 'Name', 'Procedure', 'Phone', 'Email', 'DateTime', 'WhatsApp', 'Notes'),
             show='headings',
-            yscrollcommand=v_scrollbar.set,
             xscrollcommand=h_scrollbar.set,
             height=15
         )
         
-        v_scrollbar.config(command=self.appointments_tree.yview)
         h_scrollbar.config(command=self.appointments_tree.xview)
         
         # Updated column setup with WhatsApp status
@@ -2184,7 +6421,15 @@ class ModernCompactClinicSystem:
             self.appointments_tree.heading(col, text=col)
             self.appointments_tree.column(col, width=width, anchor='center')
         
+        # Click a heading to sort by it, again to reverse
+        for col in AppointmentSorter.KEYS:
+            self.appointments_tree.heading(col, command=lambda c=col: self.sort_appointments(c))
+        
         self.appointments_tree.pack(fill='both', expand=True)
+        
+        # Diffed refreshes; very long lists are only materialized around the scroll position
+        self.appointments_view = VirtualTreeView(self.appointments_tree, v_scrollbar,
+                                                 appointment_tree_values)
 
     def create_reports_page(self):
         """Create comprehensive reports and analytics page"""
@@ -2209,7 +6454,17 @@ class ModernCompactClinicSystem:
         search_frame.pack(fill='x', pady=(0, 10), padx=5)
         
         search_inner = tk.Frame(search_frame, bg=theme["bg_secondary"])
-        search_inner.pack(fill='x', padx=15, pady=10)
+        search_inner.pack(fill='x', padx=15, pady=(10, 0))
+        
+        self.search_status_label = tk.Label(
+            search_frame,
+            text="",
+            bg=theme["bg_secondary"],
+            fg=theme["text_secondary"],
+            font=self.fonts["small"],
+            anchor='w'
+        )
+        self.search_status_label.pack(fill='x', padx=15, pady=(2, 5))
         
         tk.Label(
             search_inner,
@@ -2234,6 +6489,18 @@ class ModernCompactClinicSystem:
         )
         search_entry.pack(side='left', fill='x', expand=True, padx=(10, 5))
         
+        # Typo-tolerant patient-name matching ("Mohamad" finds "Mohammed")
+        self.fuzzy_search_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            search_inner,
+            text="Fuzzy names",
+            variable=self.fuzzy_search_var,
+            command=self.live_search,
+            bg=theme["bg_secondary"],
+            fg=theme["text_primary"],
+            font=self.fonts["small"]
+        ).pack(side='left', padx=(0, 5))
+        
         clear_search_btn = tk.Button(
             search_inner,
             text="❌",
@@ -2543,6 +6810,17 @@ class ModernCompactClinicSystem:
                 cursor='hand2'
             )
             btn.pack(side='left', padx=2)
+        
+        # Background save statistics
+        self.save_stats_label = tk.Label(
+            data_section,
+            text="💾 No changes saved yet",
+            bg=theme["bg_secondary"],
+            fg=theme["text_secondary"],
+            font=self.fonts["small"],
+            anchor='w'
+        )
+        self.save_stats_label.pack(fill='x', padx=10, pady=(0, 10))
 
     def create_floating_actions(self):
         """Create floating action buttons with WhatsApp controls"""
@@ -2644,11 +6922,27 @@ class ModernCompactClinicSystem:
 
     def start_auto_save(self):
         """Start auto-save functionality"""
+        # Changes are written by the background writer as they happen; the
+        # periodic tick only retries anything left dirty and refreshes the stats
         if self.auto_save_active:
-            self.save_data()
-            self.save_reminder_data()
+            self.update_save_stats()
             self.root.after(30000, self.start_auto_save)  # Auto-save every 30 seconds
 
+    def update_save_stats(self):
+        """Show background save duration and size in the settings page"""
+        if not hasattr(self, 'save_stats_label'):
+            return
+        stats = self.writer.stats
+        if stats["last_error"]:
+            text = f"Last save failed: {stats['last_error']}"
+        elif stats["last_saved_at"]:
+            text = (f"Last save {stats['last_saved_at']}: {stats['last_duration_ms']:.1f} ms, "
+                    f"{stats['last_bytes'] / 1024:.1f} KB (max {stats['max_duration_ms']:.1f} ms, "
+                    f"{stats['saves']} saves)")
+        else:
+            text = "No changes saved yet"
+        self.save_stats_label.config(text=f"💾 {text}")
+
     def quick_save(self):
         """Quick save current form"""
         if self.current_page == "add":
@@ -2674,7 +6968,7 @@ class ModernCompactClinicSystem:
         apt_id = int(item['values'][0])
         
         # Find appointment
-        appointment = next((apt for apt in self.appointments if apt['id'] == apt_id), None)
+        appointment = self.appointments.get(apt_id)
         if not appointment:
             self.show_toast("Appointment not found!", "error")
             return
@@ -2867,82 +7161,102 @@ class ModernCompactClinicSystem:
 
     def refresh_appointments(self):
         """Refresh appointments display with WhatsApp status"""
-        # Clear existing items
-        for item in self.appointments_tree.get_children():
-            self.appointments_tree.delete(item)
-        
-        # Add appointments
-        for apt in self.appointments:
-            # Truncate long text for display
-            name = apt['patient_name'][:15] + "..." if len(apt['patient_name']) > 15 else apt['patient_name']
-            procedure = apt['procedure'][:12] + "..." if len(apt['procedure']) > 12 else apt['procedure']
-            notes = apt.get('notes', '')[:12] + "..." if len(apt.get('notes', '')) > 12 else apt.get('notes', '')
-            
-            # Create datetime display
-            date_str = apt.get('appointment_date', 'N/A')
-            time_str = apt.get('appointment_time', '09:00')
-            datetime_str = f"{date_str} {time_str}"
-            
-            # WhatsApp status
-            whatsapp_status = "📱ON" if apt.get('enable_reminders', True) else "📱OFF"
-            
-            self.appointments_tree.insert('', 'end', values=(
-                apt['id'],
-                name,
-                procedure,
-                apt['phone_number'],
-                apt.get('email', ''),  # ADD EMAIL
-                datetime_str,
-                whatsapp_status,
-                notes
-            ))
+        rows = self.appointments
+        if self.view_filter is not None:
+            rows = self.view_filter.run(self.appointments, self.search_index)
+            self.view_filter_label.config(text=f"{len(rows)} of {len(self.appointments)}")
+        
+        if self.view_sort is not None:
+            # The sorter's permutation is already up to date; just walk it
+            ids = self.appointment_sorter.order(*self.view_sort)
+            if self.view_filter is not None:
+                shown = {apt['id'] for apt in rows}
+                ids = [apt_id for apt_id in ids if apt_id in shown]
+            records = self.appointments.snapshot()
+            rows = [records[apt_id] for apt_id in ids if apt_id in records]
+        
+        # Only rows whose record version changed are rewritten
+        self.appointments_view.set_rows(rows)
         
         self.update_stats()
 
+    def sort_appointments(self, column):
+        """Sort the View page by a column; clicking the same column again reverses it"""
+        descending = self.view_sort == (column, False)
+        self.view_sort = (column, descending)
+        for col in AppointmentSorter.KEYS:
+            arrow = (" ▼" if descending else " ▲") if col == column else ""
+            self.appointments_tree.heading(col, text=col + arrow)
+        self.refresh_appointments()
+        self.appointments_view.scroll_to_top()
+
+    def apply_view_filter(self):
+        """Show only the appointments matching the filter expression"""
+        text = self.view_filter_var.get().strip()
+        try:
+            self.view_filter = AppointmentFilter(text) if text else None
+        except FilterSyntaxError as e:
+            self.show_toast(str(e), "warning")
+            return
+        if self.view_filter is None:
+            self.view_filter_label.config(text="")
+        self.refresh_appointments()
+
+    def clear_view_filter(self):
+        """Show every appointment again"""
+        self.view_filter_var.set("")
+        self.apply_view_filter()
+
     def live_search(self, *args):
-        """Perform live search as user types"""
-        search_term = self.search_var.get().strip().lower()
-        
-        # Clear results
-        for item in self.search_tree.get_children():
-            self.search_tree.delete(item)
-        
-        if not search_term:
+        """Search once the user pauses typing, not on every keystroke"""
+        if self.search_after_id:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self.run_live_search)
+
+    def run_live_search(self):
+        """Hand the query to the search worker; results stream back over the UI event bus"""
+        self.search_after_id = None
+        term = self.search_var.get()
+        if looks_like_filter(term):
+            # Filter expressions (procedure:MRI date:...) run against the indexes
+            try:
+                query = AppointmentFilter(term)
+            except FilterSyntaxError as e:
+                self.search_executor.cancel()
+                self.search_status_label.config(text=str(e))
+                return
+            book, index = self.appointments, self.search_index
+            self.search_serial = self.search_executor.submit(
+                lambda cancelled: query.run(book, index, cancelled)[:SEARCH_RESULT_LIMIT])
             return
-        
-        # Search and display results
-        for apt in self.appointments:
-            if (search_term in apt['patient_name'].lower() or 
-                search_term in apt['phone_number'] or
-                search_term in apt['procedure'].lower() or
-                search_term in apt.get('notes', '').lower()):
-                
-                # Truncate for display
-                name = apt['patient_name'][:15] + "..." if len(apt['patient_name']) > 15 else apt['patient_name']
-                procedure = apt['procedure'][:12] + "..." if len(apt['procedure']) > 12 else apt['procedure']
-                notes = apt.get('notes', '')[:12] + "..." if len(apt.get('notes', '')) > 12 else apt.get('notes', '')
-                
-                date_str = apt.get('appointment_date', 'N/A')
-                time_str = apt.get('appointment_time', '09:00')
-                datetime_str = f"{date_str} {time_str}"
-                
-                whatsapp_status = "📱ON" if apt.get('enable_reminders', True) else "📱OFF"
-                
-                self.search_tree.insert('', 'end', values=(
-                    apt['id'],
-                    name,
-                    procedure,
-                    apt['phone_number'],
-                    datetime_str,
-                    whatsapp_status,
-                    notes
-                ))
+        # Both modes return results best match first
+        search = self.search_index.fuzzy if self.fuzzy_search_var.get() else self.search_index.search
+        self.search_serial = self.search_executor.submit(lambda cancelled: search(term, cancelled=cancelled))
+
+    def show_search_results(self, chunks):
+        """Insert streamed result chunks of the current query; older queries' chunks are dropped"""
+        for serial, rows, done, elapsed in chunks:
+            if serial != self.search_serial:
+                continue
+            if self.search_shown_serial != serial:
+                # First chunk of a new query replaces the previous results
+                self.search_shown_serial = serial
+                for item in self.search_tree.get_children():
+                    self.search_tree.delete(item)
+            for apt in rows:
+                self.search_tree.insert('', 'end', values=search_tree_values(apt))
+            if done:
+                self.search_status_label.config(
+                    text=f"{len(self.search_tree.get_children())} result(s) in {elapsed * 1000:.0f} ms "
+                         f"(p95 of recent searches: {self.search_executor.percentile(0.95) * 1000:.0f} ms)")
 
     def clear_search(self):
         """Clear search results"""
         self.search_var.set("")
+        self.search_executor.cancel()
         for item in self.search_tree.get_children():
             self.search_tree.delete(item)
+        self.search_status_label.config(text="")
 
     def edit_appointment(self):
         """Edit selected appointment"""
@@ -2955,7 +7269,7 @@ class ModernCompactClinicSystem:
         apt_id = int(item['values'][0])
         
         # Find appointment
-        appointment = next((apt for apt in self.appointments if apt['id'] == apt_id), None)
+        appointment = self.appointments.get(apt_id)
         if not appointment:
             self.show_toast("Appointment not found!", "error")
             return
@@ -3097,7 +7411,7 @@ class ModernCompactClinicSystem:
             old_reminder_status = appointment.get('enable_reminders', True)
             new_reminder_status = enable_reminders_var.get()
             
-            appointment.update({
+            updated = self.appointments.update(appointment['id'], {
                 'patient_name': edit_vars['name'].get().strip(),
                 'procedure': edit_vars['procedure'].get().strip(),
                 'phone_number': edit_vars['phone1'].get().strip(),
@@ -3112,13 +7426,13 @@ class ModernCompactClinicSystem:
             if old_reminder_status != new_reminder_status:
                 status_text = "enabled" if new_reminder_status else "disabled"
                 self.log_reminder_activity(
-                    appointment['patient_name'], 
-                    appointment['phone_number'],
+                    updated['patient_name'], 
+                    updated['phone_number'],
                     f"WhatsApp auto-reminders {status_text}", 
                     "UPDATED ⚙️"
                 )
             
-            self.save_data()
+            self.change_tracker.mark_appointment(updated)
             self.refresh_appointments()
             dialog.destroy()
             self.show_toast("Appointment updated successfully!", "success")
@@ -3160,8 +7474,8 @@ class ModernCompactClinicSystem:
             item = self.appointments_tree.item(selected[0])
             apt_id = int(item['values'][0])
             
-            # Find and log deleted appointment
-            appointment = next((apt for apt in self.appointments if apt['id'] == apt_id), None)
+            # Remove and log deleted appointment
+            appointment = self.appointments.remove(apt_id)
             if appointment:
                 self.log_reminder_activity(
                     appointment['patient_name'], 
@@ -3170,21 +7484,19 @@ class ModernCompactClinicSystem:
                     "DELETED 🗑️"
                 )
             
-            self.appointments = [apt for apt in self.appointments if apt['id'] != apt_id]
-            self.save_data()
+            self.change_tracker.mark_deleted(apt_id)
             self.refresh_appointments()
             self.show_toast("Appointment deleted successfully!", "success")
 
     def update_stats(self):
         """Update statistics with WhatsApp data"""
         total = len(self.appointments)
-        today = date.today()
+        today = date.today().strftime('%Y-%m-%d')
         
-        today_count = sum(1 for apt in self.appointments 
-                         if apt.get('appointment_date') == today.strftime('%Y-%m-%d'))
+        today_count = self.appointments.indexes.count_between(today, today)
         
         # Count WhatsApp messages sent
-        whatsapp_sent = len(self.sent_reminders)
+        whatsapp_sent = self.delivery_ledger.count("whatsapp")
         
         # Update sidebar stats
         if hasattr(self, 'stats_labels'):
@@ -3201,13 +7513,17 @@ class ModernCompactClinicSystem:
             self.total_count_label.config(text=str(len(self.appointments)))
         
         if hasattr(self, 'whatsapp_count_label'):
-            self.whatsapp_count_label.config(text=str(len(self.sent_reminders)))
+            self.whatsapp_count_label.config(text=str(self.delivery_ledger.count("whatsapp")))
+        
+        if hasattr(self, 'week_count_label'):
+            week_start = date.today() - timedelta(days=date.today().weekday())
+            week_end = week_start + timedelta(days=6)
+            week_count = self.appointments.indexes.count_between(
+                week_start.strftime('%Y-%m-%d'), week_end.strftime('%Y-%m-%d'))
+            self.week_count_label.config(text=str(week_count))
         
         # Count procedures
-        procedure_counts = {}
-        for apt in self.appointments:
-            proc = apt['procedure'].split(':')[0]
-            procedure_counts[proc] = procedure_counts.get(proc, 0) + 1
+        procedure_counts = self.appointments.indexes.procedure_counts()
         
         # Update procedure list
         if hasattr(self, 'procedure_listbox'):
@@ -3335,9 +7651,9 @@ class ModernCompactClinicSystem:
         if filename:
             try:
                 export_data = {
-                    'appointments': self.appointments,
+                    'appointments': [apt.to_dict() for apt in self.appointments],
                     'whatsapp_reminder_settings': self.reminder_settings,
-                    'sent_whatsapp_reminders': self.sent_reminders
+                    'delivery_ledger': self.delivery_ledger.rows()
                 }
                 with open(filename, 'w') as f:
                     json.dump(export_data, f, indent=2, default=str)
@@ -3360,37 +7676,51 @@ class ModernCompactClinicSystem:
                     # Handle different import formats
                     if isinstance(imported_data, list):
                         # Old format - just appointments
-                        self.appointments = imported_data
+                        self.load_appointment_records(imported_data, self.appointments.next_id)
                     else:
                         # New format - with WhatsApp data
-                        self.appointments = imported_data.get('appointments', [])
+                        self.load_appointment_records(imported_data.get('appointments', []), self.appointments.next_id)
                         if 'whatsapp_reminder_settings' in imported_data:
                             self.reminder_settings.update(imported_data['whatsapp_reminder_settings'])
-                        if 'sent_whatsapp_reminders' in imported_data:
-                            self.sent_reminders = imported_data['sent_whatsapp_reminders']
+                        if 'delivery_ledger' in imported_data:
+                            self.delivery_ledger.import_rows(imported_data['delivery_ledger'])
+                        elif 'sent_whatsapp_reminders' in imported_data:
+                            self.delivery_ledger.import_rows(
+                                legacy_ledger_rows(imported_data['sent_whatsapp_reminders']))
                     
                     self.save_data()
-                    self.save_reminder_data()
                     self.refresh_all()
                     self.show_toast("Data imported successfully!", "success")
             except Exception as e:
                 self.show_toast(f"Import failed: {str(e)}", "error")
 
     def save_data(self):
-        """Save data to file"""
-        try:
-            with open('appointments.json', 'w') as f:
-                json.dump(self.appointments, f, indent=2, default=str)
-        except Exception as e:
-            self.show_toast(f"Save failed: {str(e)}", "error")
+        """Queue a full rewrite of all appointments for the background writer"""
+        self.change_tracker.mark_all(self.appointments)
+        self.change_tracker.mark_meta('next_appointment_id', self.appointments.next_id)
+
+    def load_appointment_records(self, records, next_id=None):
+        """Fill the appointment book, repairing duplicate ids left by older versions"""
+        repaired = self.appointments.load([Appointment.from_dict(apt) for apt in records], next_id)
+        # Build the search postings off the Tk thread so the first keystroke does not pay for it
+        threading.Thread(target=self.search_index.warm, name="search-index", daemon=True).start()
+        if repaired:
+            # Rows sharing an id cannot be addressed individually, so rewrite them all once
+            self.save_data()
+            for old_id, new_id in repaired:
+                self.log_reminder_activity("System", "", f"Duplicate appointment id {old_id} renumbered to {new_id}", "REPAIRED 🔧")
+        return repaired
 
     def load_data(self):
-        """Load data from file"""
+        """Load data from the database, migrating legacy JSON files on first run"""
         try:
-            if os.path.exists('appointments.json'):
-                with open('appointments.json', 'r') as f:
-                    self.appointments = json.load(f)
-                self.update_stats()
+            # Reloading must not race ahead of changes still queued for the writer
+            self.writer.save_pending()
+            if self.store.migrate_from_json():
+                self.show_toast("Imported existing appointments into the database", "info")
+            self.load_appointment_records(self.store.load_appointments(),
+                                          self.store.get_meta('next_appointment_id'))
+            self.update_stats()
         except Exception as e:
             self.show_toast(f"Load failed: {str(e)}", "error")
 
@@ -3469,22 +7799,65 @@ Never miss an appointment with AUTO WHATSAPP! 📱✨
     def on_closing(self):
         """Handle application closing"""
         try:
-            # Stop reminder system
+            # Stop reminder system and the send queues
             self.stop_reminder_system()
+            for dispatcher in self.dispatchers.values():
+                dispatcher.stop()
+            self.outbox.stop()
+            self.stop_notification_engine()
+            self.smtp_pool.close()
             
-            # Save all data
-            self.save_data()
-            self.save_reminder_data()
+            # Save settings; appointments and sent reminders are already in the database
             self.save_reminder_settings()
+            self.whatsapp_transport.close()
+            self.change_tracker.mark_meta('last_heartbeat', datetime.now().isoformat(timespec='seconds'))
             
             # Log system shutdown
             self.log_reminder_activity("System", "", "Auto WhatsApp system closing", "SHUTDOWN 🔌")
+            self.reminder_logger.close()
+            
+            # Flush pending changes, but never hang the window on a stuck disk
+            if not self.writer.flush(deadline=5.0):
+                print("Background writer did not finish before the close deadline")
+            else:
+                self.store.checkpoint()
+                self.store.close()
             
             self.root.destroy()
         except:
             self.root.destroy()
 
 if __name__ == "__main__":
+    # Storage backend: python "CLAUDE 8.py" --storage journal|sqlite
+    # (an installation should stay on one: SQLite imports the JSON files once, never the other way)
+    if "--storage" in sys.argv:
+        args = sys.argv[sys.argv.index("--storage") + 1:]
+        if not args or args[0] not in STORAGE_BACKENDS:
+            sys.exit(f"--storage takes one of: {', '.join(STORAGE_BACKENDS)}")
+        STORAGE_BACKEND = args[0]
+    # Offline throughput check: python "CLAUDE 8.py" --benchmark-whatsapp [count]
+    if "--benchmark-whatsapp" in sys.argv:
+        args = sys.argv[sys.argv.index("--benchmark-whatsapp") + 1:]
+        benchmark_whatsapp_transport(int(args[0]) if args else 500)
+        sys.exit(0)
+    # SMTP session reuse check: python "CLAUDE 8.py" --benchmark-email [count]
+    if "--benchmark-email" in sys.argv:
+        args = sys.argv[sys.argv.index("--benchmark-email") + 1:]
+        benchmark_email(int(args[0]) if args else 200)
+        sys.exit(0)
+    # Search latency check: python "CLAUDE 8.py" --benchmark-search [patients]
+    if "--benchmark-search" in sys.argv:
+        args = sys.argv[sys.argv.index("--benchmark-search") + 1:]
+        benchmark_search(int(args[0]) if args else 100000)
+        sys.exit(0)
+    # Filter language check against brute force: python "CLAUDE 8.py" --check-filters [appointments]
+    if "--check-filters" in sys.argv:
+        args = sys.argv[sys.argv.index("--check-filters") + 1:]
+        sys.exit(1 if check_appointment_filters(int(args[0]) if args else 20000) else 0)
+    # Thread-safety check of the data layer: python "CLAUDE 8.py" --stress-test [seconds]
+    if "--stress-test" in sys.argv:
+        args = sys.argv[sys.argv.index("--stress-test") + 1:]
+        sys.exit(1 if stress_test_appointment_book(float(args[0]) if args else 5.0) else 0)
     try:
         app = ModernCompactClinicSystem()
         app.run()